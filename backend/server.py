@@ -15,20 +15,337 @@ import os
 import subprocess
 import asyncio
 import atexit
+import gzip
+import hashlib
+import hmac
+import itertools
+import json
+import math
+import re
+import secrets
+import signal
+import socket
+import sys
+import time
+import zlib
 import httpx
+from collections import OrderedDict, deque
 from pathlib import Path
+from urllib.parse import parse_qsl, urlencode
 from fastapi import FastAPI, Request, Response, WebSocket, WebSocketDisconnect
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from starlette.middleware.cors import CORSMiddleware
 import websockets
 
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
 ROOT_DIR = Path(__file__).parent
-TS_PORT = 8002
-TS_URL = f"http://127.0.0.1:{TS_PORT}"
+TS_PORT = int(os.environ.get('TS_PORT', '8002'))
+
+# Pool of TS workers, one port each (TS_PORT, TS_PORT+1, ...). Worker 0 is the
+# primary: it alone runs the scheduler/indexer jobs and serves /ws.
+TS_WORKERS = os.environ.get('TS_WORKERS', '1')
+TS_WORKERS = (os.cpu_count() or 1) if TS_WORKERS == 'auto' else max(1, int(TS_WORKERS))
+# 'tsx' runs the real backend; 'standin' runs standin_backend.py, an offline
+# fake with recorded/synthetic responses, for benchmarking the proxy alone
+TS_BACKEND = os.environ.get('TS_BACKEND', 'tsx')
+
+# How the TS backend is launched: 'tsx' transpiles src/ on every boot; 'bundle'
+# runs dist/bundle/server-<hash>.mjs with plain node, building it with esbuild
+# when no bundle matches the current sources; 'auto' runs a matching bundle if
+# one was built (python server.py build) and tsx otherwise. The hash covers
+# src/, tsconfig.json and package-lock.json, so a stale bundle is never run.
+TS_LAUNCH = os.environ.get('TS_LAUNCH', 'auto')
+BUNDLE_DIR = ROOT_DIR / 'dist' / 'bundle'
+WORKER_HEALTH_INTERVAL = float(os.environ.get('PROXY_WORKER_HEALTH_INTERVAL', '5'))
+
+# Unix domain sockets instead of TCP loopback: each worker gets SOCKET_PATH
+# (PROXY_UDS_DIR/blockview-ts-<port>.sock) and HTTP/WS to it go over the
+# socket. A worker that never creates its socket but answers on its TCP port
+# (e.g. an older build) is used over TCP.
+PROXY_UDS = os.environ.get('PROXY_UDS', 'false').lower() == 'true' and hasattr(socket, 'AF_UNIX')
+UDS_DIR = os.environ.get('PROXY_UDS_DIR', '/tmp')
+
+# Supervisor: a worker that exits on its own is respawned on the same port after
+# an exponential backoff (reset once it stayed up SUPERVISOR_STABLE_SECONDS).
+# CRASH_LOOP_THRESHOLD exits within CRASH_LOOP_WINDOW seconds flag a crash loop
+# and pin the backoff at its maximum. Each recovery gets a fresh upstream pool.
+SUPERVISOR_INTERVAL = float(os.environ.get('PROXY_SUPERVISOR_INTERVAL', '0.5'))
+RESTART_BACKOFF_INITIAL = float(os.environ.get('PROXY_RESTART_BACKOFF_INITIAL', '0.5'))
+RESTART_BACKOFF_MAX = float(os.environ.get('PROXY_RESTART_BACKOFF_MAX', '30'))
+SUPERVISOR_STABLE_SECONDS = float(os.environ.get('PROXY_SUPERVISOR_STABLE_SECONDS', '60'))
+CRASH_LOOP_THRESHOLD = int(os.environ.get('PROXY_CRASH_LOOP_THRESHOLD', '5'))
+CRASH_LOOP_WINDOW = float(os.environ.get('PROXY_CRASH_LOOP_WINDOW', '120'))
+
+# Blue/green restarts (SIGHUP or POST /proxy/restart): a new worker set boots on
+# the alternate port range (TS_PORT+TS_WORKERS, ...) and takes over once healthy;
+# the old set is stopped after its requests and WebSockets drain. The new worker 0
+# boots as a standby and is promoted to primary (jobs, Telegram polling) only once
+# the old primary has stopped. The admin endpoint is disabled unless
+# PROXY_ADMIN_TOKEN is set and then needs a matching x-admin-token.
+RESTART_DRAIN_TIMEOUT = float(os.environ.get('PROXY_RESTART_DRAIN_TIMEOUT', '30'))
+PROXY_ADMIN_TOKEN = os.environ.get('PROXY_ADMIN_TOKEN', '')
+# Shared with the TS workers only; authorizes the proxy's internal calls (promote)
+PROXY_CONTROL_TOKEN = secrets.token_hex(16)
+
+# Stream request/response bodies through in chunks instead of buffering them
+PROXY_STREAMING = os.environ.get('PROXY_STREAMING', 'true').lower() == 'true'
+HOP_HEADERS = ('transfer-encoding', 'connection')
+# GETs served from memory (cache, coalescing, batch) buffer at most this many body
+# bytes; a larger one is streamed instead and its target skips buffering for a while
+BUFFER_MAX_BYTES = int(os.environ.get('PROXY_BUFFER_MAX_BYTES', str(1024 * 1024)))
+OVERSIZED_TTL = float(os.environ.get('PROXY_OVERSIZED_TTL', '300'))
+OVERSIZED_MAX_TARGETS = 4096
+
+# Readiness gate: requests arriving before /api/health passes wait (bounded)
+READY_POLL_INITIAL = float(os.environ.get('PROXY_READY_POLL_INITIAL', '0.05'))
+READY_POLL_MAX = float(os.environ.get('PROXY_READY_POLL_MAX', '1.0'))
+READY_TIMEOUT = float(os.environ.get('PROXY_READY_TIMEOUT', '180'))
+READY_QUEUE_LIMIT = int(os.environ.get('PROXY_READY_QUEUE_LIMIT', '1000'))
+READY_WAIT_TIMEOUT = float(os.environ.get('PROXY_READY_WAIT_TIMEOUT', '30'))
+
+# In-proxy response cache for read-only GETs whose data only changes when the
+# scheduler jobs run or the user writes. (route template, ttl s, stale-while-revalidate s,
+# vary on x-user-id, tags: data domains the response is built from; {user} is the caller)
+PROXY_CACHE_ENABLED = os.environ.get('PROXY_CACHE_ENABLED', 'true').lower() == 'true'
+PROXY_CACHE_MAX_BYTES = int(os.environ.get('PROXY_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+CACHE_RULES = [
+    ('/api/market/top-active-tokens', 60, 300, False, ('market',)),
+    ('/api/market/emerging-signals', 60, 300, False, ('signals', 'market')),
+    ('/api/market/new-actors', 60, 300, False, ('wallets', 'market')),
+    ('/api/market/token-signals/:addr', 60, 300, False, ('signals', 'market')),
+    ('/api/market/token-activity/:addr', 60, 300, False, ('market', 'prices')),
+    ('/api/market/token-drivers/:addr', 60, 300, False, ('market', 'wallets', 'prices')),
+    ('/api/alerts/sensitivity-presets', 300, 3600, False, ()),
+    ('/api/alerts/rules', 60, 60, True, ('alert-rules:{user}', 'alerts')),
+    ('/api/alerts/rules/:id/feedback', 60, 60, True, ('alert-rules:{user}', 'alerts')),
+    ('/api/watchlist', 60, 60, True, ('watchlist:{user}',)),
+    # Its alertCount counts the user's active rules, which only rule writes
+    # change; those purge watchlist:{user} below, so alert jobs need not
+    ('/api/watchlist/:id', 60, 60, True, ('watchlist:{user}',)),
+]
+
+# Write-through: a successful write on these routes purges the caller's cached
+# reads it affects, so their next GET sees the change (read-your-writes)
+WRITE_INVALIDATIONS = [
+    # Rule writes also touch the watchlist: creating a rule auto-creates its item
+    ('/api/alerts/rules', ('alert-rules:{user}', 'watchlist:{user}')),
+    ('/api/alerts/rules/:id', ('alert-rules:{user}', 'watchlist:{user}')),
+    ('/api/alerts/rules/:id/sensitivity', ('alert-rules:{user}', 'watchlist:{user}')),
+    ('/api/alerts/rules/:id/pause', ('alert-rules:{user}', 'watchlist:{user}')),
+    ('/api/alerts/rules/:id/reduce-sensitivity', ('alert-rules:{user}', 'watchlist:{user}')),
+    ('/api/watchlist', ('watchlist:{user}',)),
+    ('/api/watchlist/:id', ('watchlist:{user}',)),
+]
+
+# Tag invalidation: the primary TS worker broadcasts job.completed on /ws and the
+# proxy purges the domains that job rewrites. While that feed is connected, tagged
+# entries live for CACHE_TAGGED_TTL instead of their rule's ttl; when it drops,
+# every tagged entry is purged since events may have been missed.
+PROXY_CACHE_TAGS = os.environ.get('PROXY_CACHE_TAGS', 'true').lower() == 'true'
+CACHE_TAGGED_TTL = float(os.environ.get('PROXY_CACHE_TAGGED_TTL', '600'))
+# How long a tag's last purge is remembered for fills still in flight; well past
+# any upstream timeout, older purges only raise ResponseCache.purge_floor
+CACHE_PURGE_MEMORY = 600
+JOB_TAGS = {
+    'erc20-indexer': ('market', 'signals', 'wallets'),  # new transfers feed the on-the-fly aggregates
+    'build-transfers': ('wallets',),
+    'build-relations': ('wallets',),
+    'build-signals': ('signals',),
+    'build-strategy-signals': ('signals',),
+    'build-price-points': ('prices',),
+    'build-market-metrics': ('market',),
+    'evaluate-alert-rules': ('alerts',),
+    'dispatch-alerts': ('alerts',),
+}
+
+# Cache warmer: keep the per-token endpoints of the top active tokens cached so
+# the first visitor after a scheduler cycle does not pay for the cold query.
+# Targets use the query strings the frontend sends; {addr} is the token address.
+PROXY_WARMER_ENABLED = os.environ.get('PROXY_WARMER_ENABLED', 'true').lower() == 'true'
+WARM_SOURCE = os.environ.get('PROXY_WARM_SOURCE', '/api/market/top-active-tokens?limit=8&window=24h')
+WARM_TARGETS = os.environ.get(
+    'PROXY_WARM_TARGETS',
+    '/api/market/token-signals/{addr},'
+    '/api/market/token-activity/{addr}?window=24h,'
+    '/api/market/token-drivers/{addr}?chain=Ethereum&limit=10',
+).split(',')
+WARM_TOP_N = int(os.environ.get('PROXY_WARM_TOP_N', '8'))
+WARM_CONCURRENCY = int(os.environ.get('PROXY_WARM_CONCURRENCY', '2'))
+WARM_INTERVAL = float(os.environ.get('PROXY_WARM_INTERVAL', '20'))
+WARM_MAX_INTERVAL = float(os.environ.get('PROXY_WARM_MAX_INTERVAL', '300'))
+WARM_LOAD_THRESHOLD = float(os.environ.get('PROXY_WARM_LOAD_THRESHOLD', '0.5'))  # of a limiter's limit in use
+
+# Single-flight: concurrent identical GETs on these routes share one upstream
+# call. The key is method + path/query + the headers the response varies on.
+PROXY_COALESCE_ENABLED = os.environ.get('PROXY_COALESCE_ENABLED', 'true').lower() == 'true'
+COALESCE_ROUTES = [
+    '/api/market/token-activity/:addr',
+    '/api/market/token-drivers/:addr',
+    '/api/market/token-clusters/:addr',
+    '/api/market/token-smart-money/:addr',
+    '/api/wallets/:addr/activity-snapshot',
+]
+COALESCE_HEADERS = ('x-user-id', 'authorization', 'cookie', 'accept', 'accept-encoding')
 
-ts_process = None
+# POST /api/batch: several GETs in one round trip, each going through the same
+# rate limit, cache and single-flight as a direct request
+BATCH_MAX_REQUESTS = int(os.environ.get('PROXY_BATCH_MAX_REQUESTS', '20'))
+BATCH_CONCURRENCY = int(os.environ.get('PROXY_BATCH_CONCURRENCY', '6'))
+
+# WebSocket hub: one upstream /ws connection fanned out to every browser client,
+# with subscriptions tracked in the proxy instead of one upstream socket per client
+PROXY_WS_HUB = os.environ.get('PROXY_WS_HUB', 'false').lower() == 'true'
+
+# Outbound frames to each WebSocket client go through a bounded queue so a slow
+# client cannot stall its relay or grow proxy memory. On overflow: 'drop-oldest',
+# 'conflate' (keep the newest frame per channel, then drop oldest) or 'disconnect'.
+WS_SEND_QUEUE_MAX = int(os.environ.get('PROXY_WS_SEND_QUEUE_MAX', '256'))
+WS_OVERFLOW_POLICY = os.environ.get('PROXY_WS_OVERFLOW_POLICY', 'drop-oldest')
+
+# Last frame per channel, replayed from memory when a client subscribes (hello /
+# subscribe) so it has current state without a bootstrap REST call. A channel is a
+# frame's `channel`, else its category plus the id of what it describes (dedupKey,
+# alertId, ...); replayed copies carry "replayed": true. Bounded to WS_SNAPSHOT_MAX
+# channels; frames older than WS_SNAPSHOT_TTL seconds are not replayed. Each
+# upstream frame is recorded once: by the hub, or in passthrough mode by one
+# recorder connection to the primary.
+PROXY_WS_SNAPSHOTS = os.environ.get('PROXY_WS_SNAPSHOTS', 'true').lower() == 'true'
+WS_SNAPSHOT_MAX = int(os.environ.get('PROXY_WS_SNAPSHOT_MAX', '512'))
+WS_SNAPSHOT_TTL = float(os.environ.get('PROXY_WS_SNAPSHOT_TTL', '300'))
+WS_SNAPSHOT_CATEGORIES = set(os.environ.get('PROXY_WS_SNAPSHOT_CATEGORIES', 'bootstrap,resolver,attribution,alerts,signals').split(','))
+
+# Every upstream request carries X-Request-Deadline (epoch ms) = now + its route
+# class read timeout; the backend skips requests that waited past it and marks
+# that 503 with X-Deadline-Exceeded. Only the proxy sets the deadline: a client's
+# own header is dropped. Upstream calls are cancelled when the client leaves.
+PROXY_FORWARD_DEADLINE = os.environ.get('PROXY_FORWARD_DEADLINE', 'true').lower() == 'true'
+DEADLINE_HEADER = 'x-request-deadline'
+DEADLINE_EXCEEDED_HEADER = 'x-deadline-exceeded'
+
+# Upstream connection pool. Timeouts are per route class: (connect, read, pool)
+# seconds, overridable as PROXY_TIMEOUTS_<CLASS>="connect,read,pool".
+PROXY_POOL_MAX_CONNECTIONS = int(os.environ.get('PROXY_POOL_MAX_CONNECTIONS', '200'))
+PROXY_POOL_MAX_KEEPALIVE = int(os.environ.get('PROXY_POOL_MAX_KEEPALIVE', '100'))
+PROXY_POOL_KEEPALIVE_EXPIRY = float(os.environ.get('PROXY_POOL_KEEPALIVE_EXPIRY', '30'))
+ROUTE_CLASS_TIMEOUTS = {
+    'fast': (1.0, 10.0, 2.0),
+    'default': (2.0, 30.0, 5.0),
+    'heavy': (2.0, 60.0, 10.0),
+    'write': (2.0, 30.0, 5.0),
+}
+for _name in ROUTE_CLASS_TIMEOUTS:
+    if os.environ.get(f'PROXY_TIMEOUTS_{_name.upper()}'):
+        ROUTE_CLASS_TIMEOUTS[_name] = tuple(float(v) for v in os.environ[f'PROXY_TIMEOUTS_{_name.upper()}'].split(','))
+FAST_ROUTES = [
+    '/api/health',
+    '/api/system/indexing-status',
+    '/api/market/known-tokens',
+]
+HEAVY_ROUTES = COALESCE_ROUTES + [
+    '/api/market/top-active-tokens',
+    '/api/market/emerging-signals',
+    '/api/market/new-actors',
+]
+
+# Load shedding. Each non-fast route class gets a concurrency limit that adapts
+# to upstream latency (gradient: shrinks once recent latency exceeds
+# LIMIT_TOLERANCE x the minimum RTT of the last LIMIT_RTT_WINDOW seconds plus
+# LIMIT_RTT_SLACK, grows while the limit is actually used). Requests over it
+# wait for a slot behind at most LIMIT_QUEUE others for up to LIMIT_QUEUE_TIMEOUT,
+# then get 503 + Retry-After instead of queueing into the 60 s timeout. A per-route
+# circuit breaker opens when the 5xx/timeout rate over the window is too high.
+PROXY_LIMITER_ENABLED = os.environ.get('PROXY_LIMITER_ENABLED', 'true').lower() == 'true'
+LIMIT_INITIAL = int(os.environ.get('PROXY_LIMIT_INITIAL', '50'))
+LIMIT_MIN = int(os.environ.get('PROXY_LIMIT_MIN', '20'))
+LIMIT_MAX = int(os.environ.get('PROXY_LIMIT_MAX', '500'))
+LIMIT_TOLERANCE = float(os.environ.get('PROXY_LIMIT_TOLERANCE', '2.0'))
+LIMIT_RTT_SLACK = float(os.environ.get('PROXY_LIMIT_RTT_SLACK_MS', '50')) / 1000
+LIMIT_RTT_WINDOW = int(os.environ.get('PROXY_LIMIT_RTT_WINDOW', '30'))
+LIMIT_SMOOTHING = float(os.environ.get('PROXY_LIMIT_SMOOTHING', '0.2'))
+LIMIT_QUEUE = int(os.environ.get('PROXY_LIMIT_QUEUE', '100'))
+LIMIT_QUEUE_TIMEOUT = float(os.environ.get('PROXY_LIMIT_QUEUE_TIMEOUT_MS', '1000')) / 1000
+PROXY_BREAKER_ENABLED = os.environ.get('PROXY_BREAKER_ENABLED', 'true').lower() == 'true'
+BREAKER_WINDOW = int(os.environ.get('PROXY_BREAKER_WINDOW', '10'))
+BREAKER_MIN_REQUESTS = int(os.environ.get('PROXY_BREAKER_MIN_REQUESTS', '20'))
+BREAKER_ERROR_RATE = float(os.environ.get('PROXY_BREAKER_ERROR_RATE', '0.5'))
+BREAKER_COOLDOWN = float(os.environ.get('PROXY_BREAKER_COOLDOWN', '10'))
+
+# Per-user rate limiting: a token bucket per (x-user-id, route class) as
+# (tokens/s, burst), overridable as PROXY_RATE_LIMIT_<CLASS>="rate,burst".
+# Requests without x-user-id, or with a shared placeholder id such as the
+# frontend's demo 'anonymous' (RATE_LIMIT_SHARED_IDS), are not limited; one
+# bucket for every browser would throttle the whole site. Buckets live in
+# RATE_LIMIT_SHARDS dicts per class, capped at RATE_LIMIT_MAX_KEYS per class.
+PROXY_RATE_LIMIT_ENABLED = os.environ.get('PROXY_RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_QUOTAS = {
+    'fast': (50.0, 100.0),
+    'default': (20.0, 60.0),
+    'heavy': (5.0, 20.0),
+    'write': (5.0, 20.0),
+}
+for _name in RATE_LIMIT_QUOTAS:
+    if os.environ.get(f'PROXY_RATE_LIMIT_{_name.upper()}'):
+        RATE_LIMIT_QUOTAS[_name] = tuple(float(v) for v in os.environ[f'PROXY_RATE_LIMIT_{_name.upper()}'].split(','))
+RATE_LIMIT_SHARDS = int(os.environ.get('PROXY_RATE_LIMIT_SHARDS', '16'))
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('PROXY_RATE_LIMIT_MAX_KEYS', '500000'))
+RATE_LIMIT_SWEEP_INTERVAL = float(os.environ.get('PROXY_RATE_LIMIT_SWEEP_INTERVAL', '1'))
+RATE_LIMIT_SHARED_IDS = set(filter(None, os.environ.get('PROXY_RATE_LIMIT_SHARED_IDS', 'anonymous').split(',')))
+
+# /proxy/metrics: routes are labelled by template so cardinality stays bounded.
+# Paths matching none of these get id-like segments collapsed (:addr, :id).
+METRICS_MAX_ROUTES = int(os.environ.get('PROXY_METRICS_MAX_ROUTES', '300'))
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+ROUTE_TEMPLATES = [
+    '/api/wallets/:addr/activity-snapshot',
+    '/api/alerts/rules/:id',
+    '/api/alerts/rules/:id/feedback',
+    '/api/alerts/rules/:id/sensitivity',
+    '/api/watchlist/:id',
+]
+
+# Response compression negotiated on Accept-Encoding. Bodies the origin already
+# encoded pass through untouched; big bodies, buffered or streamed past the
+# threshold, compress off the event loop.
+PROXY_COMPRESSION = os.environ.get('PROXY_COMPRESSION', 'true').lower() == 'true'
+COMPRESS_MIN_BYTES = int(os.environ.get('PROXY_COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_OFFLOOP_BYTES = int(os.environ.get('PROXY_COMPRESS_OFFLOOP_BYTES', str(64 * 1024)))
+COMPRESS_GZIP_LEVEL = int(os.environ.get('PROXY_COMPRESS_GZIP_LEVEL', '6'))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('PROXY_COMPRESS_BROTLI_QUALITY', '4'))
+COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/javascript', 'image/svg+xml')
+
+# Strong ETags from a content hash of upstream bodies; If-None-Match is answered
+# with 304. Streamed GET bodies up to PROXY_ETAG_MAX_BYTES are buffered to hash.
+PROXY_ETAG = os.environ.get('PROXY_ETAG', 'true').lower() == 'true'
+ETAG_MAX_BYTES = int(os.environ.get('PROXY_ETAG_MAX_BYTES', str(1024 * 1024)))
+CONDITIONAL_HEADERS = ('if-none-match', 'if-modified-since')
+
+workers = []
+draining = []  # previous worker set while a blue/green restart drains it
 http_client = None
 
+background_tasks = set()
+
+backend_ready = None
+restart_state = {
+    'state': 'idle',      # idle | starting | draining
+    'generation': 0,
+    'restarts': 0,
+    'failed': 0,
+    'last': None,
+}
+readiness = {
+    'state': 'stopped',   # stopped | starting | ready | failed
+    'phases': {},         # phase -> ms since startup began
+    'waiting': 0,
+    'rejected': 0,
+    'timedOut': 0,
+}
+
 app = FastAPI(title="BlockView Proxy", docs_url=None, redoc_url=None)
 
 app.add_middleware(
@@ -39,96 +356,2773 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def cleanup():
-    global ts_process
-    if ts_process:
-        ts_process.terminate()
+class TsWorker:
+    """One TypeScript backend process on its own port."""
+    
+    def __init__(self, index, port=None):
+        self.index = index
+        self.port = port or TS_PORT + index
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.ws_url = f"ws://127.0.0.1:{self.port}/ws"
+        self.primary = index == 0
+        self.standby = False  # primary-to-be of a blue/green restart, jobs not started yet
+        self.process = None
+        self.healthy = False
+        self.outstanding = 0
+        self.served = 0
+        self.sockets = set()  # upstream WebSockets relayed by ws_passthrough
+        self.draining = False
+        self.socket_path = os.path.join(UDS_DIR, f"blockview-ts-{self.port}.sock") if PROXY_UDS else None
+        self.transport = 'tcp'  # 'uds' once spawned with a socket
+        self.started_at = None
+        self.launch = None  # 'tsx' | 'bundle' | 'standin'
+        self.boot_ms = None
+        self.crashes = deque()  # exit times inside CRASH_LOOP_WINDOW
+        self.backoff = 0
+        self.restarts = 0
+        self.last_exit = None
+        self.crash_loop = False
+    
+    def spawn(self, env):
+        role = 'standby' if self.standby else 'primary' if self.primary else 'replica'
+        env = dict(env, PORT=str(self.port), WORKER_ROLE=role)
+        if self.socket_path:
+            env['SOCKET_PATH'] = self.socket_path
+            self.transport = 'uds'
+            upstream_sockets[self.port] = self.socket_path
+        self.started_at = time.monotonic()
+        self.boot_ms = None
+        if TS_BACKEND == 'standin':
+            self.launch = 'standin'
+            standin = str(ROOT_DIR / 'standin_backend.py')
+            self.process = subprocess.Popen([sys.executable, standin], cwd=str(ROOT_DIR), env=env)
+            return
+        bundle = current_bundle() if TS_LAUNCH != 'tsx' else None
+        if bundle is not None:
+            self.launch = 'bundle'
+            self.process = subprocess.Popen(['node', '--enable-source-maps', str(bundle)], cwd=str(ROOT_DIR), env=env)
+            return
+        self.launch = 'tsx'
+        tsx = str(ROOT_DIR / 'node_modules' / '.bin' / 'tsx')
+        server = str(ROOT_DIR / 'src' / 'server.ts')
+        self.process = subprocess.Popen([tsx, server], cwd=str(ROOT_DIR), env=env)
+    
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+    
+    def use_tcp(self):
+        """Fall back to TCP loopback for a worker that did not bind its socket."""
+        print(f"[Proxy] TS worker {self.index} has no unix socket, using TCP port {self.port}")
+        self.transport = 'tcp'
+        upstream_sockets.pop(self.port, None)
+    
+    def ws_connect(self, **kwargs):
+        """websockets connect() for this worker's /ws over its current transport."""
+        if self.transport == 'uds':
+            return websockets.unix_connect(self.socket_path, self.ws_url, **kwargs)
+        return websockets.connect(self.ws_url, **kwargs)
+    
+    async def promote(self):
+        """Start a standby's primary jobs; a standby that is down comes back as primary."""
+        self.standby = False
+        if self.launch == 'standin' or not self.alive():
+            return  # the stand-in runs no jobs
+        for attempt in range(3):
+            try:
+                resp = await http_client.post(f"{self.url}/internal/promote", headers={'x-proxy-control': PROXY_CONTROL_TOKEN})
+                if resp.status_code == 200:
+                    print(f"[Proxy] TS worker {self.index} promoted to primary")
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(1)
+        print(f"[Proxy] TS worker {self.index} could not be promoted; jobs start on its next restart")
+    
+    def stop(self):
+        if self.process:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except:
+                self.process.kill()
+        self.healthy = False
+    
+    def status(self):
+        return {
+            'port': self.port,
+            'primary': self.primary,
+            'standby': self.standby,
+            'alive': self.alive(),
+            'healthy': self.healthy,
+            'outstanding': self.outstanding,
+            'served': self.served,
+            'sockets': len(self.sockets),
+            'draining': self.draining,
+            'restarts': self.restarts,
+            'lastExitCode': self.last_exit,
+            'crashLoop': self.crash_loop,
+            'launch': self.launch,
+            'bootMs': self.boot_ms,
+            'transport': self.transport,
+        }
+
+def source_hash():
+    """Content hash of everything the bundle is built from."""
+    digest = hashlib.sha256()
+    files = sorted(p for p in (ROOT_DIR / 'src').rglob('*') if p.is_file())
+    for path in files + [ROOT_DIR / 'tsconfig.json', ROOT_DIR / 'package-lock.json']:
+        if path.exists():
+            digest.update(str(path.relative_to(ROOT_DIR)).encode() + b'\0')
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+def bundle_path(digest=None):
+    return BUNDLE_DIR / f"server-{digest or source_hash()}.mjs"
+
+bundle_state = {'hash': None, 'path': None, 'buildMs': None, 'error': None}
+
+def current_bundle():
+    """The bundle matching the sources as of the last check, or None."""
+    path = bundle_state['path']
+    return Path(path) if path and Path(path).exists() else None
+
+def refresh_bundle(build):
+    """
+    Re-hash the sources and point current_bundle() at the matching bundle,
+    building it first when `build` is set. Blocking; run off the event loop.
+    """
+    digest = source_hash()
+    target = bundle_path(digest)
+    bundle_state.update(hash=digest, path=None, error=None)
+    if not target.exists() and build:
+        esbuild = ROOT_DIR / 'node_modules' / '.bin' / 'esbuild'
+        if not esbuild.exists():
+            esbuild = ROOT_DIR / 'node_modules' / 'esbuild' / 'bin' / 'esbuild'
+        # Build next to the final location, then move it in: a half-written
+        # bundle must never match the hash
+        staging = BUNDLE_DIR / '.staging'
+        staging.mkdir(parents=True, exist_ok=True)
+        started = time.monotonic()
         try:
-            ts_process.wait(timeout=5)
-        except:
-            ts_process.kill()
+            subprocess.run(
+                [str(esbuild), 'src/server.ts', '--bundle', '--platform=node', '--format=esm', '--target=node20',
+                 '--packages=external', '--sourcemap', '--log-level=warning', f'--outfile={staging / target.name}'],
+                cwd=str(ROOT_DIR), check=True, timeout=300,
+            )
+        except (OSError, subprocess.SubprocessError) as exc:
+            bundle_state['error'] = str(exc)
+            print(f"[Proxy] Bundle build failed, falling back to tsx: {exc}")
+            return None
+        os.replace(staging / f"{target.name}.map", f"{target}.map")
+        os.replace(staging / target.name, target)
+        bundle_state['buildMs'] = round((time.monotonic() - started) * 1000, 1)
+        print(f"[Proxy] Built {target.name} in {bundle_state['buildMs']} ms")
+        for stale in BUNDLE_DIR.glob('server-*'):
+            if not stale.name.startswith(target.name):
+                stale.unlink()
+    if target.exists():
+        bundle_state['path'] = str(target)
+        return target
+    return None
 
-atexit.register(cleanup)
+upstream_sockets = {}  # worker port -> unix socket path, for workers reached over UDS
 
-@app.on_event("startup")
-async def startup():
-    global ts_process, http_client
+class UpstreamTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport that sends each request to its worker's unix socket when
+    the worker has one (looked up by port in upstream_sockets), and over
+    TCP otherwise. Every socket gets its own pool with the same limits.
+    """
+    
+    def __init__(self, limits):
+        self.limits = limits
+        self.tcp = httpx.AsyncHTTPTransport(limits=limits)
+        self.unix = {}  # socket path -> transport
+    
+    async def handle_async_request(self, request):
+        path = upstream_sockets.get(request.url.port)
+        if path is None:
+            return await self.tcp.handle_async_request(request)
+        transport = self.unix.get(path)
+        if transport is None:
+            transport = self.unix[path] = httpx.AsyncHTTPTransport(uds=path, limits=self.limits)
+        return await transport.handle_async_request(request)
+    
+    def pools(self):
+        return [t._pool for t in [self.tcp, *self.unix.values()]]
+    
+    def in_flight(self):
+        """Requests on any pool, queued or active, until their response body is closed."""
+        return sum(len(getattr(pool, '_requests', ())) for pool in self.pools())
+    
+    async def aclose(self):
+        for transport in [self.tcp, *self.unix.values()]:
+            await transport.aclose()
+
+class BackendUnavailable(Exception):
+    """No healthy TS worker to send the request to."""
+
+class ClientGone(Exception):
+    """The client disconnected before its upstream call finished; the call was cancelled."""
+
+class TooLarge(Exception):
+    """A GET body over BUFFER_MAX_BYTES; it was not read, the caller streams it instead."""
+
+oversized_targets = OrderedDict()  # target -> when its body last exceeded BUFFER_MAX_BYTES
+
+def mark_oversized(target, route):
+    oversized_targets.pop(target, None)
+    oversized_targets[target] = time.monotonic()
+    while len(oversized_targets) > OVERSIZED_MAX_TARGETS:
+        oversized_targets.popitem(last=False)
+    metrics.unbuffered.inc(route)
+    return TooLarge(target)
+
+def known_oversized(target):
+    seen = oversized_targets.get(target)
+    if seen is None:
+        return False
+    if time.monotonic() - seen > OVERSIZED_TTL:
+        del oversized_targets[target]
+        return False
+    return True
+
+class UpstreamReply:
+    """A fully buffered upstream response (raw, still-encoded body)."""
+    
+    __slots__ = ('status_code', 'headers', 'body', 'etag')
+    
+    def __init__(self, status_code, headers, body):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.etag = None  # filled in by content_etag()
+
+class CacheEntry:
+    __slots__ = ('reply', 'stored', 'ttl', 'swr', 'size', 'fill_target', 'fill_headers', 'variants', 'tags')
+    
+    def __init__(self, reply, ttl, swr, fill_target, fill_headers, tags=()):
+        self.reply = reply
+        self.stored = time.monotonic()
+        self.ttl = ttl
+        self.swr = swr
+        self.size = len(reply.body) + sum(len(k) + len(v) for k, v in reply.headers.items())
+        self.fill_target = fill_target
+        self.fill_headers = fill_headers
+        self.variants = {}  # content-encoding -> compressed body
+        self.tags = tags
+    
+    def age(self):
+        return time.monotonic() - self.stored
+
+class ResponseCache:
+    """
+    LRU of upstream replies bounded by total bytes.
+    
+    get() classifies an entry as 'fresh' (age < ttl), 'stale' (inside the
+    stale-while-revalidate window) or drops it once both have passed.
+    purge() drops every entry carrying one of the given tags, bumps `epoch`
+    and records it as those tags' last purge; a fill that read the epoch
+    before it fetched passes it to put(), which drops the fill only if one
+    of its own tags was purged since, so data fetched before a purge is not
+    stored after it while unrelated fills are unaffected.
+    """
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.refreshing = set()
+        self.tags = {}  # tag -> keys
+        self.epoch = 0
+        self.purged = OrderedDict()  # tag -> (epoch of its last purge, when), oldest first
+        self.purge_floor = 0  # fills older than this may predate a forgotten purge
+        self.stats = {'hits': 0, 'stale': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'refreshes': 0, 'purged': 0, 'dropped': 0}
+    
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None, None
+        age = entry.age()
+        if age >= entry.ttl + entry.swr:
+            self.pop(key)
+            self.stats['misses'] += 1
+            return None, None
+        self.entries.move_to_end(key)
+        if age < entry.ttl:
+            self.stats['hits'] += 1
+            return entry, 'fresh'
+        self.stats['stale'] += 1
+        return entry, 'stale'
+    
+    def put(self, key, entry, epoch=None):
+        if entry.size > self.max_bytes:
+            return
+        if self.stale_fill(entry.tags, epoch):
+            self.stats['dropped'] += 1
+            return
+        self.pop(key)
+        self.entries[key] = entry
+        self.size += entry.size
+        for tag in entry.tags:
+            self.tags.setdefault(tag, set()).add(key)
+        self.stats['stores'] += 1
+        while self.size > self.max_bytes:
+            self.pop(next(iter(self.entries)))
+            self.stats['evictions'] += 1
+    
+    def renew(self, key, entry, epoch=None):
+        """Restart an entry's ttl once upstream confirmed it unchanged, keeping its variants."""
+        entry.stored = time.monotonic()
+        if self.entries.get(key) is not entry:
+            self.put(key, entry, epoch)
+    
+    def add_variant(self, key, entry, encoding, body):
+        """Keep a compressed copy on an entry that is still cached, counting its bytes."""
+        if self.entries.get(key) is not entry:
+            return
+        entry.variants[encoding] = body
+        entry.size += len(body)
+        self.size += len(body)
+    
+    def pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+            for tag in entry.tags:
+                keys = self.tags.get(tag)
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+        return entry
+    
+    def stale_fill(self, tags, epoch):
+        """True if a fill that read `epoch` before fetching may hold data purged since."""
+        if not tags or epoch is None:
+            return False
+        if epoch < self.purge_floor:
+            return True
+        return any(self.purged.get(tag, (0, 0))[0] > epoch for tag in tags)
+    
+    def purge_epoch(self, tags):
+        """Epoch of the latest purge of any of `tags` (the floor if it may be forgotten)."""
+        return max([self.purge_floor] + [self.purged[tag][0] for tag in tags if tag in self.purged])
+    
+    def purge(self, tags):
+        """Drop every entry tagged with any of `tags`; returns how many went."""
+        self.epoch += 1
+        now = time.monotonic()
+        for tag in tags:
+            self.purged.pop(tag, None)
+            self.purged[tag] = (self.epoch, now)
+        while self.purged and now - next(iter(self.purged.values()))[1] > CACHE_PURGE_MEMORY:
+            _, (epoch, _) = self.purged.popitem(last=False)
+            self.purge_floor = max(self.purge_floor, epoch)
+        keys = set().union(*(self.tags.get(tag, ()) for tag in tags))
+        for key in keys:
+            self.pop(key)
+        self.stats['purged'] += len(keys)
+        return len(keys)
+    
+    def status(self):
+        return {'entries': len(self.entries), 'bytes': self.size, 'maxBytes': self.max_bytes, **self.stats}
+
+etag_stats = {'notModified': 0, 'bytesSaved': 0, 'revalidated': 0}
+
+def content_etag(reply):
+    """The upstream ETag if it sent one, else a strong tag from a blake2b hash of the raw body."""
+    if reply.etag is None:
+        reply.etag = reply.headers.get('etag') or f'"{hashlib.blake2b(reply.body, digest_size=12).hexdigest()}"'
+    return reply.etag
+
+def variant_etag(etag, encoding):
+    """Distinct strong tag for a representation the proxy compressed: "abc" -> "abc-br"."""
+    return f'{etag[:-1]}-{encoding}"' if etag.endswith('"') else etag
+
+def opaque_tag(tag):
+    tag = tag.strip()
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    tag = tag.strip('"')
+    for encoding in ('-br', '-gzip'):
+        if tag.endswith(encoding):
+            return tag[:-len(encoding)]
+    return tag
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison as If-None-Match requires; our encoding suffixes are ignored."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    current = opaque_tag(etag)
+    return any(opaque_tag(tag) == current for tag in if_none_match.split(','))
+
+def unconditional(headers):
+    """Drop client validators from a request the proxy fills on everyone's behalf."""
+    return {k: v for k, v in headers.items() if k.lower() not in CONDITIONAL_HEADERS}
+
+def compile_template(template):
+    """'/api/market/token-signals/:addr' -> anchored regex matching one segment per param."""
+    return re.compile('^' + re.sub(r':[A-Za-z_]\w*', '[^/]+', template) + '/?$')
+
+cache_rules = [(compile_template(t), t, ttl, swr, vary_user, tags) for t, ttl, swr, vary_user, tags in CACHE_RULES]
+response_cache = ResponseCache(PROXY_CACHE_MAX_BYTES)
+
+def match_cache_rule(path):
+    for pattern, template, ttl, swr, vary_user, tags in cache_rules:
+        if pattern.match(path):
+            return template, ttl, swr, vary_user, tags
+    return None
+
+write_invalidations = [(compile_template(t), tags) for t, tags in WRITE_INVALIDATIONS]
+write_through_stats = {'writes': 0, 'purgedEntries': 0}
+
+def user_tags(tags, user):
+    return tuple(tag.replace('{user}', user) for tag in tags)
+
+def write_through(method, path, user, response):
+    """Purge the caller's cached reads a successful write on `path` made stale."""
+    if method in ('GET', 'HEAD', 'OPTIONS') or response.status_code >= 400:
+        return response
+    for pattern, tags in write_invalidations:
+        if pattern.match(path):
+            write_through_stats['writes'] += 1
+            write_through_stats['purgedEntries'] += response_cache.purge(user_tags(tags, user))
+            break
+    return response
+
+def entry_ttl(ttl, tags):
+    """The rule's ttl, stretched for tagged entries while job events can purge them."""
+    if tags and cache_invalidator.connected:
+        return max(ttl, CACHE_TAGGED_TTL)
+    return ttl
+
+class SingleFlight:
+    """
+    Share one in-flight call among concurrent callers with the same key.
+    
+    The call runs as its own task and callers await it through shield(), so
+    a leader whose client disconnects does not cancel it for the followers;
+    it is cancelled only once every caller has gone.
+    """
+    
+    def __init__(self):
+        self.calls = {}
+        self.waiters = {}  # task -> callers still awaiting it
+        self.stats = {'leaders': 0, 'followers': 0, 'abandoned': 0}
+    
+    async def do(self, key, fn):
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self.calls[key] = task
+            self.waiters[task] = 0
+            task.add_done_callback(lambda t: self.finish(key, t))
+            self.stats['leaders'] += 1
+        else:
+            self.stats['followers'] += 1
+        self.waiters[task] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if not task.done():
+                self.waiters[task] -= 1
+                if not self.waiters[task]:
+                    task.cancel()
+                    self.stats['abandoned'] += 1
+    
+    def finish(self, key, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        self.waiters.pop(task, None)
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every caller went away
+    
+    def status(self):
+        return {'inFlight': len(self.calls), **self.stats}
+
+coalesce_routes = [compile_template(t) for t in COALESCE_ROUTES]
+single_flight = SingleFlight()
+
+def match_coalesce_route(path):
+    return any(pattern.match(path) for pattern in coalesce_routes)
+
+fast_routes = [compile_template(t) for t in FAST_ROUTES]
+heavy_routes = [compile_template(t) for t in HEAVY_ROUTES]
+route_timeouts = {
+    name: httpx.Timeout(read, connect=connect, pool=pool)
+    for name, (connect, read, pool) in ROUTE_CLASS_TIMEOUTS.items()
+}
+
+def route_class(method, path):
+    if method not in ('GET', 'HEAD', 'OPTIONS'):
+        return 'write'
+    if any(pattern.match(path) for pattern in heavy_routes):
+        return 'heavy'
+    if any(pattern.match(path) for pattern in fast_routes):
+        return 'fast'
+    return 'default'
+
+class PoolStats:
+    """
+    Connection-pool instrumentation.
+    
+    Pool wait time comes from the httpx `trace` extension: the gap between
+    sending a request and its headers going out, minus any TCP connect. A
+    request that never connected reused a keep-alive connection.
+    """
     
+    def __init__(self):
+        self.classes = {
+            name: {'requests': 0, 'newConnections': 0, 'reused': 0, 'waitSeconds': 0.0, 'maxWaitSeconds': 0.0, 'poolTimeouts': 0}
+            for name in ROUTE_CLASS_TIMEOUTS
+        }
+        self.rebuilds = 0
+    
+    def tracer(self, route_class):
+        stats = self.classes[route_class]
+        stats['requests'] += 1
+        started = time.monotonic()
+        connect = {'started': None, 'seconds': 0.0, 'new': False}
+        
+        async def trace(event, info):
+            now = time.monotonic()
+            if event in ('connection.connect_tcp.started', 'connection.connect_unix_socket.started'):
+                connect['started'] = now
+            elif event in ('connection.connect_tcp.complete', 'connection.connect_unix_socket.complete') and connect['started'] is not None:
+                connect['seconds'] += now - connect['started']
+                connect['new'] = True
+            elif event in ('http11.send_request_headers.started', 'http2.send_request_headers.started'):
+                wait = max(0.0, now - started - connect['seconds'])
+                stats['waitSeconds'] += wait
+                stats['maxWaitSeconds'] = max(stats['maxWaitSeconds'], wait)
+                stats['newConnections' if connect['new'] else 'reused'] += 1
+        return trace
+    
+    def snapshot(self):
+        """Live pool occupancy (reads httpcore's pools; empty if they are not reachable)."""
+        transport = getattr(http_client, '_transport', None)
+        pools = transport.pools() if isinstance(transport, UpstreamTransport) else []
+        connections = [c for pool in pools for c in getattr(pool, 'connections', [])]
+        idle = sum(1 for c in connections if c.is_idle())
+        waiters = sum(1 for pool in pools for r in getattr(pool, '_requests', []) if getattr(r, 'connection', None) is None)
+        return {
+            'maxConnections': PROXY_POOL_MAX_CONNECTIONS,
+            'maxKeepalive': PROXY_POOL_MAX_KEEPALIVE,
+            'keepaliveExpiry': PROXY_POOL_KEEPALIVE_EXPIRY,
+            'connections': len(connections),
+            'inUse': len(connections) - idle,
+            'idle': idle,
+            'waiters': waiters,
+            'unixSockets': len(pools) - 1 if pools else 0,
+        }
+    
+    def status(self):
+        classes = {}
+        for name, stats in self.classes.items():
+            waited = stats['newConnections'] + stats['reused']
+            classes[name] = {
+                **stats,
+                'avgWaitMs': round(stats['waitSeconds'] / waited * 1000, 3) if waited else 0.0,
+                'timeouts': dict(zip(('connect', 'read', 'pool'), ROUTE_CLASS_TIMEOUTS[name])),
+            }
+        return {**self.snapshot(), 'rebuilds': self.rebuilds, 'classes': classes}
+
+pool_stats = PoolStats()
+
+def upstream_request(method, url, headers, content=None):
+    """Build an upstream request with its route-class timeout and pool tracing."""
+    path = httpx.URL(url).path
+    kind = route_class(method, path)
+    headers = {k: v for k, v in headers.items() if k.lower() != DEADLINE_HEADER}
+    if PROXY_FORWARD_DEADLINE:
+        headers[DEADLINE_HEADER] = str(int((time.time() + route_timeouts[kind].read) * 1000))
+    return http_client.build_request(
+        method,
+        url,
+        content=content,
+        headers=headers,
+        timeout=route_timeouts[kind],
+        extensions={'trace': pool_stats.tracer(kind)},
+    ), kind
+
+class Overloaded(Exception):
+    """Request shed before reaching the backend (limit reached or circuit open)."""
+    
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdaptiveLimiter:
+    """
+    Gradient concurrency limit for one route class.
+    
+    Every upstream round trip feeds its latency in. The baseline is the
+    minimum RTT over the last LIMIT_RTT_WINDOW seconds (1 s buckets), so it
+    is neither pinned to the first sample nor dragged up by sustained load.
+    The limit is scaled by (LIMIT_TOLERANCE x baseline + LIMIT_RTT_SLACK) /
+    recent latency, capped at 1 and floored at 0.5, plus sqrt(limit) queue
+    headroom, then smoothed: slow responses pull it down, fast ones let it
+    grow, but only while more than half of it is in use. Timeouts and
+    transport errors cut it by 10%. It never goes below LIMIT_MIN. Slots
+    freed by release() go to queued acquire() calls first, in FIFO order.
+    """
+    
+    def __init__(self):
+        self.limit = float(LIMIT_INITIAL)
+        self.in_flight = 0
+        self.short_rtt = None
+        self.min_rtt = None
+        self.rtt_buckets = deque()  # [second, min rtt]
+        self.waiters = deque()
+        self.stats = {'admitted': 0, 'queued': 0, 'shed': 0, 'drops': 0}
+    
+    async def acquire(self):
+        """Take a slot, waiting up to LIMIT_QUEUE_TIMEOUT if the limit is reached; False to shed."""
+        if self.in_flight < int(self.limit) and not self.waiters:
+            self.in_flight += 1
+            self.stats['admitted'] += 1
+            return True
+        if len(self.waiters) >= LIMIT_QUEUE or LIMIT_QUEUE_TIMEOUT <= 0:
+            self.stats['shed'] += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self.stats['queued'] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), LIMIT_QUEUE_TIMEOUT)
+            return True
+        except asyncio.TimeoutError:
+            if waiter.done():
+                return True  # granted while timing out
+            self.waiters.remove(waiter)
+            self.stats['shed'] += 1
+            return False
+        except BaseException:
+            if waiter.done():
+                self.release()
+            else:
+                self.waiters.remove(waiter)
+            raise
+    
+    def wake(self):
+        """Hand free slots to queued acquire() calls."""
+        while self.waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            self.stats['admitted'] += 1
+            self.waiters.popleft().set_result(None)
+    
+    def observe_min(self, rtt):
+        second = int(time.monotonic())
+        if self.rtt_buckets and self.rtt_buckets[-1][0] == second:
+            self.rtt_buckets[-1][1] = min(self.rtt_buckets[-1][1], rtt)
+            self.min_rtt = min(self.min_rtt, rtt)
+            return
+        self.rtt_buckets.append([second, rtt])
+        while self.rtt_buckets[0][0] <= second - LIMIT_RTT_WINDOW:
+            self.rtt_buckets.popleft()
+        self.min_rtt = min(bucket[1] for bucket in self.rtt_buckets)
+    
+    def release(self, rtt=None, dropped=False):
+        """Free a slot; `rtt` None means the call was abandoned and teaches nothing."""
+        in_flight = self.in_flight
+        self.in_flight -= 1
+        self.adjust(in_flight, rtt, dropped)
+        self.wake()
+    
+    def adjust(self, in_flight, rtt, dropped):
+        if dropped:
+            self.stats['drops'] += 1
+            self.limit = max(LIMIT_MIN, self.limit * 0.9)
+            return
+        if rtt is None:
+            return
+        rtt = max(rtt, 0.0001)
+        self.short_rtt = rtt if self.short_rtt is None else self.short_rtt * 0.9 + rtt * 0.1
+        self.observe_min(rtt)
+        allowed = LIMIT_TOLERANCE * self.min_rtt + LIMIT_RTT_SLACK
+        gradient = max(0.5, min(1.0, allowed / self.short_rtt))
+        if gradient == 1.0 and in_flight < self.limit / 2:
+            return  # app-limited: no evidence the backend could take more
+        target = self.limit * gradient + math.sqrt(self.limit)
+        self.limit = min(LIMIT_MAX, max(LIMIT_MIN, self.limit * (1 - LIMIT_SMOOTHING) + target * LIMIT_SMOOTHING))
+    
+    def status(self):
+        return {
+            'limit': int(self.limit),
+            'inFlight': self.in_flight,
+            'waiting': len(self.waiters),
+            'shortRttMs': round(self.short_rtt * 1000, 2) if self.short_rtt else None,
+            'minRttMs': round(self.min_rtt * 1000, 2) if self.min_rtt else None,
+            **self.stats,
+        }
+
+class CircuitBreaker:
+    """
+    Per-route breaker over a rolling window of 1 s buckets.
+    
+    closed -> open when the window holds BREAKER_MIN_REQUESTS outcomes with
+    an error rate >= BREAKER_ERROR_RATE; open sheds everything for
+    BREAKER_COOLDOWN; then half-open lets one probe through, whose outcome
+    closes or re-opens the circuit.
+    """
+    
+    def __init__(self):
+        self.state = 'closed'
+        self.buckets = deque()  # [second, requests, errors]
+        self.opened_at = 0.0
+        self.probing = False
+        self.trips = 0
+    
+    def allow(self):
+        """None if the request may go upstream, else seconds until it is worth retrying."""
+        if self.state == 'closed':
+            return None
+        remaining = self.opened_at + BREAKER_COOLDOWN - time.monotonic()
+        if self.state == 'open' and remaining > 0:
+            return remaining
+        if self.probing:
+            return 1.0
+        self.state = 'half-open'
+        self.probing = True
+        return None
+    
+    def cancel_probe(self):
+        self.probing = False
+    
+    def record(self, ok):
+        now = time.monotonic()
+        if self.state == 'half-open':
+            self.probing = False
+            if ok:
+                self.state = 'closed'
+                self.buckets.clear()
+            else:
+                self.trip(now)
+            return
+        second = int(now)
+        if not self.buckets or self.buckets[-1][0] != second:
+            self.buckets.append([second, 0, 0])
+        while self.buckets[0][0] <= second - BREAKER_WINDOW:
+            self.buckets.popleft()
+        self.buckets[-1][1] += 1
+        self.buckets[-1][2] += 0 if ok else 1
+        requests = sum(b[1] for b in self.buckets)
+        errors = sum(b[2] for b in self.buckets)
+        if self.state == 'closed' and requests >= BREAKER_MIN_REQUESTS and errors / requests >= BREAKER_ERROR_RATE:
+            self.trip(now)
+    
+    def trip(self, now):
+        self.state = 'open'
+        self.opened_at = now
+        self.trips += 1
+        self.buckets.clear()
+    
+    def status(self):
+        requests = sum(b[1] for b in self.buckets)
+        errors = sum(b[2] for b in self.buckets)
+        return {'state': self.state, 'trips': self.trips, 'windowRequests': requests, 'windowErrors': errors}
+
+class Admission:
+    """A slot granted by admit(); settle() once with the outcome, release() in finally."""
+    
+    __slots__ = ('limiter', 'breaker', 'started', 'settled')
+    
+    def __init__(self, limiter, breaker):
+        self.limiter = limiter
+        self.breaker = breaker
+        self.started = time.monotonic()
+        self.settled = False
+    
+    def settle(self, status_code=None, headers=None):
+        """Record a response status, or None for a timeout/transport failure."""
+        if self.settled:
+            return
+        if headers is not None and headers.get(DEADLINE_EXCEEDED_HEADER):
+            # Skipped by the backend for outliving its deadline: says nothing about the route's health
+            self.release()
+            return
+        self.settled = True
+        ok = status_code is not None and status_code < 500
+        if self.limiter:
+            self.limiter.release(time.monotonic() - self.started, dropped=status_code is None)
+        if self.breaker:
+            self.breaker.record(ok)
+    
+    def release(self):
+        """Free the slot of a call that was abandoned (e.g. client went away)."""
+        if self.settled:
+            return
+        self.settled = True
+        if self.limiter:
+            self.limiter.release()
+        if self.breaker:
+            self.breaker.cancel_probe()
+
+limiters = {name: AdaptiveLimiter() for name in ROUTE_CLASS_TIMEOUTS if name != 'fast'}
+breakers = {}
+
+async def admit(kind, route):
+    """Admission for an upstream call of class `kind` on `route`; raises Overloaded to shed it."""
+    breaker = None
+    if PROXY_BREAKER_ENABLED and kind != 'fast':
+        breaker = breakers.get(route)
+        if breaker is None:
+            breaker = breakers[route] = CircuitBreaker()
+        retry_after = breaker.allow()
+        if retry_after is not None:
+            metrics.shed.inc(route, 'circuit_open')
+            raise Overloaded('circuit_open', retry_after)
+    limiter = limiters.get(kind) if PROXY_LIMITER_ENABLED else None
+    try:
+        acquired = limiter is None or await limiter.acquire()
+    except BaseException:
+        if breaker:
+            breaker.cancel_probe()
+        raise
+    if not acquired:
+        if breaker:
+            breaker.cancel_probe()
+        metrics.shed.inc(route, 'concurrency')
+        raise Overloaded('concurrency', 1)
+    return Admission(limiter, breaker)
+
+class RateLimiter:
+    """
+    Token buckets per user and route class, sharded by user id.
+    
+    A bucket is just [tokens, last_update]. A bucket left idle long enough to
+    refill to its burst behaves exactly like a missing one, so the sweeper
+    (one shard per tick) drops those without changing any outcome. A shard
+    that is still full on insert drops its oldest-inserted buckets, which
+    keeps memory bounded at the cost of forgiving those users.
+    """
+    
+    def __init__(self, quotas, shards, max_keys):
+        self.quotas = quotas
+        self.shards = {kind: [{} for _ in range(shards)] for kind in quotas}
+        self.shard_cap = max(1, max_keys // shards)
+        self.sweep_order = [(kind, index) for index in range(shards) for kind in quotas]
+        self.sweep_cursor = 0
+        self.stats = {'allowed': 0, 'limited': 0, 'evictedIdle': 0, 'evictedFull': 0}
+    
+    def take(self, user, kind):
+        """Spend one token: 0 if allowed, else seconds until the next token."""
+        rate, burst = self.quotas[kind]
+        shards = self.shards[kind]
+        shard = shards[hash(user) % len(shards)]
+        now = time.monotonic()
+        bucket = shard.get(user)
+        if bucket is None:
+            if len(shard) >= self.shard_cap:
+                self.make_room(shard, rate, burst, now)
+            shard[user] = [burst - 1, now]
+            self.stats['allowed'] += 1
+            return 0.0
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            self.stats['allowed'] += 1
+            return 0.0
+        bucket[0] = tokens
+        self.stats['limited'] += 1
+        return (1 - tokens) / rate
+    
+    def evict_idle(self, shard, rate, burst, now):
+        idle = [user for user, (tokens, updated) in shard.items() if tokens + (now - updated) * rate >= burst]
+        for user in idle:
+            del shard[user]
+        self.stats['evictedIdle'] += len(idle)
+    
+    def make_room(self, shard, rate, burst, now):
+        self.evict_idle(shard, rate, burst, now)
+        while len(shard) >= self.shard_cap:
+            del shard[next(iter(shard))]
+            self.stats['evictedFull'] += 1
+    
+    def sweep(self):
+        """Evict idle buckets from the next shard in turn."""
+        kind, index = self.sweep_order[self.sweep_cursor]
+        self.sweep_cursor = (self.sweep_cursor + 1) % len(self.sweep_order)
+        rate, burst = self.quotas[kind]
+        self.evict_idle(self.shards[kind][index], rate, burst, time.monotonic())
+    
+    def status(self):
+        return {
+            'quotas': {kind: {'rate': rate, 'burst': burst} for kind, (rate, burst) in self.quotas.items()},
+            'buckets': {kind: sum(len(shard) for shard in shards) for kind, shards in self.shards.items()},
+            'shards': len(self.shards['default']),
+            'maxKeysPerClass': self.shard_cap * len(self.shards['default']),
+            **self.stats,
+        }
+
+rate_limiter = RateLimiter(RATE_LIMIT_QUOTAS, RATE_LIMIT_SHARDS, RATE_LIMIT_MAX_KEYS)
+
+def rate_limit_wait(user, method, path):
+    """Spend a token for `user` on this route; 0 when allowed, else seconds to wait."""
+    if not PROXY_RATE_LIMIT_ENABLED or not user or user in RATE_LIMIT_SHARED_IDS:
+        return 0.0
+    kind = route_class(method, path)
+    retry_after = rate_limiter.take(user, kind)
+    if retry_after:
+        metrics.rate_limited.inc(kind)
+    return retry_after
+
+def rate_limited(request: Request, path):
+    """429 response when the caller's bucket for this route class is empty, else None."""
+    retry_after = rate_limit_wait(request.headers.get('x-user-id'), request.method, path)
+    if not retry_after:
+        return None
+    return JSONResponse(status_code=429, content={"error": "Rate limit exceeded"}, headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+async def sweep_rate_buckets():
+    while True:
+        await asyncio.sleep(RATE_LIMIT_SWEEP_INTERVAL)
+        rate_limiter.sweep()
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Metric:
+    """A counter, gauge or histogram family rendered in Prometheus text format."""
+    
+    def __init__(self, kind, name, help_text, labelnames=(), buckets=None):
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.series = {}
+    
+    def inc(self, *labels, value=1):
+        self.series[labels] = self.series.get(labels, 0) + value
+    
+    def set(self, *labels, value):
+        self.series[labels] = value
+    
+    def observe(self, *labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+    
+    def label_text(self, labels, extra=None):
+        pairs = list(zip(self.labelnames, labels))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{k}="{escape_label(v)}"' for k, v in pairs) + '}'
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self.series.items()):
+            if self.kind != 'histogram':
+                lines.append(f"{self.name}{self.label_text(labels)} {value}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{self.label_text(labels, ('le', bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{self.label_text(labels, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{self.label_text(labels)} {total}")
+            lines.append(f"{self.name}_count{self.label_text(labels)} {count}")
+        return lines
+
+class ProxyMetrics:
+    def __init__(self):
+        self.families = []
+        self.requests = self.add('counter', 'proxy_requests_total', 'Requests handled by the proxy', ('route', 'method', 'status'))
+        self.duration = self.add('histogram', 'proxy_request_duration_seconds', 'End-to-end request time in the proxy', ('route',), LATENCY_BUCKETS)
+        self.upstream_duration = self.add('histogram', 'proxy_upstream_duration_seconds', 'Time spent waiting on the TS backend', ('route',), LATENCY_BUCKETS)
+        self.overhead = self.add('histogram', 'proxy_overhead_seconds', 'Request time not spent waiting on the TS backend', ('route',), LATENCY_BUCKETS)
+        self.upstream_responses = self.add('counter', 'proxy_upstream_responses_total', 'Upstream responses by status code', ('route', 'status'))
+        self.bytes_in = self.add('counter', 'proxy_request_bytes_total', 'Request body bytes received from clients', ('route',))
+        self.bytes_out = self.add('counter', 'proxy_response_bytes_total', 'Response body bytes sent to clients', ('route',))
+        self.in_flight = self.add('gauge', 'proxy_in_flight_requests', 'Requests currently being handled by the proxy')
+        self.ws_connections = self.add('gauge', 'proxy_ws_connections', 'Open client WebSocket connections')
+        self.ws_connections_total = self.add('counter', 'proxy_ws_connections_total', 'Client WebSocket connections accepted')
+        self.rate_limited = self.add('counter', 'proxy_rate_limited_total', 'Requests rejected by the per-user rate limit', ('route_class',))
+        self.shed = self.add('counter', 'proxy_shed_total', 'Requests rejected before reaching the backend', ('route', 'reason'))
+        self.canceled = self.add('counter', 'proxy_upstream_canceled_total', 'Upstream calls cancelled because the client disconnected', ('route',))
+        self.unbuffered = self.add('counter', 'proxy_unbuffered_total', 'GET bodies too large to buffer, streamed instead', ('route',))
+        self.ws_messages = self.add('counter', 'proxy_ws_messages_total', 'WebSocket messages relayed', ('direction',))
+        self.ws_dropped = self.add('counter', 'proxy_ws_dropped_total', 'Outbound WebSocket frames dropped by a full send queue', ('reason',))
+        self.worker_exits = self.add('counter', 'proxy_worker_exits_total', 'TS worker processes that exited on their own', ('worker', 'code'))
+        self.worker_restart_seconds = self.add('histogram', 'proxy_worker_restart_seconds', 'Time from a worker exiting to it being healthy again', (), LATENCY_BUCKETS)
+        self.worker_boot_seconds = self.add('histogram', 'proxy_worker_boot_seconds', 'Time from spawning a TS worker to its first healthy check', ('launch',), LATENCY_BUCKETS)
+        self.gauges = self.add('gauge', 'proxy_state', 'Point-in-time proxy internals (workers, pool, cache)', ('component', 'field'))
+        self.in_flight.set(value=0)
+        self.ws_connections.set(value=0)
+        self.routes = set()
+        self.known_routes = [
+            (compile_template(t), t)
+            for t in [rule[0] for rule in CACHE_RULES] + COALESCE_ROUTES + FAST_ROUTES + HEAVY_ROUTES + ROUTE_TEMPLATES
+        ]
+    
+    def add(self, kind, name, help_text, labelnames=(), buckets=None):
+        metric = Metric(kind, name, help_text, labelnames, buckets)
+        self.families.append(metric)
+        return metric
+    
+    def route(self, path):
+        """Route template for a raw path; 'other' once METRICS_MAX_ROUTES distinct ones exist."""
+        for pattern, template in self.known_routes:
+            if pattern.match(path):
+                return template
+        segments = []
+        for segment in path.split('/'):
+            if segment.startswith('0x'):
+                segment = ':addr'
+            elif re.fullmatch(r'\d+|[0-9a-fA-F]{24}|[0-9a-fA-F-]{32,36}', segment):
+                segment = ':id'
+            segments.append(segment)
+        template = '/'.join(segments) or '/'
+        if template not in self.routes:
+            if len(self.routes) >= METRICS_MAX_ROUTES:
+                return 'other'
+            self.routes.add(template)
+        return template
+    
+    def render(self):
+        lines = []
+        for family in self.families:
+            lines.extend(family.render())
+        return '\n'.join(lines) + '\n'
+
+metrics = ProxyMetrics()
+
+def observe_upstream(request: Request, seconds):
+    """Attribute time spent waiting on the backend to this request (summed)."""
+    request.state.upstream_seconds = getattr(request.state, 'upstream_seconds', 0.0) + seconds
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware timing every HTTP request end to end.
+    
+    Handlers add their upstream wait via observe_upstream(); the rest of the
+    wall time is reported as proxy overhead. Timing stops when the last body
+    chunk is sent, so streamed responses are measured in full.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        
+        started = time.monotonic()
+        route = metrics.route(scope['path'])
+        status = {'code': 500, 'done': False}
+        
+        async def counting_receive():
+            message = await receive()
+            if message['type'] == 'http.request':
+                metrics.bytes_in.inc(route, value=len(message.get('body', b'')))
+            return message
+        
+        def finish():
+            if status['done']:
+                return
+            status['done'] = True
+            total = time.monotonic() - started
+            upstream = min(scope.get('state', {}).get('upstream_seconds', 0.0), total)
+            metrics.requests.inc(route, scope['method'], status['code'])
+            metrics.duration.observe(route, value=total)
+            metrics.upstream_duration.observe(route, value=upstream)
+            metrics.overhead.observe(route, value=total - upstream)
+        
+        async def counting_send(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            elif message['type'] == 'http.response.body':
+                metrics.bytes_out.inc(route, value=len(message.get('body', b'')))
+                if not message.get('more_body', False):
+                    finish()
+            await send(message)
+        
+        metrics.in_flight.inc()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            metrics.in_flight.inc(value=-1)
+            finish()
+
+app.add_middleware(MetricsMiddleware)
+
+def negotiate_encoding(accept_encoding):
+    """Pick 'br' or 'gzip' from an Accept-Encoding header (honouring q=0), or None."""
+    accepted = {}
+    for part in accept_encoding.lower().split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    wildcard = accepted.get('*', 0.0)
+    if brotli is not None and accepted.get('br', wildcard) > 0:
+        return 'br'
+    if accepted.get('gzip', wildcard) > 0:
+        return 'gzip'
+    return None
+
+def compressible(method, status_code, headers, size=None):
+    if not PROXY_COMPRESSION or method == 'HEAD' or status_code in (204, 304) or status_code < 200:
+        return False
+    if headers.get('content-encoding', 'identity') != 'identity':
+        return False
+    if 'no-transform' in headers.get('cache-control', '').lower():
+        return False
+    if size is not None and size < COMPRESS_MIN_BYTES:
+        return False
+    content_type = headers.get('content-type', '').lower()
+    return any(content_type.startswith(t) for t in COMPRESSIBLE_TYPES)
+
+def compress_bytes(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL)
+
+async def compress_body(body, encoding):
+    if len(body) >= COMPRESS_OFFLOOP_BYTES:
+        return await asyncio.to_thread(compress_bytes, body, encoding)
+    return compress_bytes(body, encoding)
+
+async def compress_stream(chunks, encoding):
+    """
+    Incrementally compress a streamed body.
+    
+    Chunks are compressed on the event loop until COMPRESS_OFFLOOP_BYTES
+    have streamed through (the threshold compress_body() uses), then in a
+    worker thread, so a large download does not stall other requests.
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        compress, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+        compress, finish = compressor.compress, compressor.flush
+    streamed = 0
+    async for chunk in chunks:
+        streamed += len(chunk)
+        if streamed >= COMPRESS_OFFLOOP_BYTES:
+            out = await asyncio.to_thread(compress, chunk)
+        else:
+            out = compress(chunk)
+        if out:
+            yield out
+    yield await asyncio.to_thread(finish) if streamed >= COMPRESS_OFFLOOP_BYTES else finish()
+
+def encoded_headers(headers, encoding, length=None):
+    headers = {k: v for k, v in headers.items() if k != 'content-length'}
+    headers['content-encoding'] = encoding
+    vary = headers.get('vary')
+    if not vary:
+        headers['vary'] = 'Accept-Encoding'
+    elif 'accept-encoding' not in vary.lower():
+        headers['vary'] = f"{vary}, Accept-Encoding"
+    if length is not None:
+        headers['content-length'] = str(length)
+    return headers
+
+def cleanup():
+    for worker in workers + draining:
+        worker.stop()
+
+atexit.register(cleanup)
+
+def backend_env():
     env = os.environ.copy()
-    env['PORT'] = str(TS_PORT)
     env['MONGODB_URI'] = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/blockview')
     env['NODE_ENV'] = os.environ.get('NODE_ENV', 'development')
     env['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'info')
     env['WS_ENABLED'] = os.environ.get('WS_ENABLED', 'true')
     env['CORS_ORIGINS'] = os.environ.get('CORS_ORIGINS', '*')
     env['INDEXER_ENABLED'] = os.environ.get('INDEXER_ENABLED', 'false')
+    env['PROXY_CONTROL_TOKEN'] = PROXY_CONTROL_TOKEN
     
     if os.environ.get('INFURA_RPC_URL'):
         env['INFURA_RPC_URL'] = os.environ.get('INFURA_RPC_URL')
-    
-    tsx = str(ROOT_DIR / 'node_modules' / '.bin' / 'tsx')
-    server = str(ROOT_DIR / 'src' / 'server.ts')
+    return env
+
+@app.on_event("startup")
+async def startup():
+    global workers, http_client, backend_ready
     
     print("=" * 60)
     print("BlockView Backend")
     print("❌ Python logic REMOVED — this is only a proxy")
     print("✅ TypeScript is the ONLY execution layer")
+    print(f"   TS workers: {TS_WORKERS} (ports {TS_PORT}-{TS_PORT + TS_WORKERS - 1}, backend={TS_BACKEND})")
     print("=" * 60)
     
-    ts_process = subprocess.Popen([tsx, server], cwd=str(ROOT_DIR), env=env)
-    http_client = httpx.AsyncClient(timeout=60.0)
-    await asyncio.sleep(3)
+    started = time.monotonic()
+    if TS_BACKEND != 'standin' and TS_LAUNCH != 'tsx':
+        await asyncio.to_thread(refresh_bundle, TS_LAUNCH == 'bundle')
+    env = backend_env()
+    workers = [TsWorker(i) for i in range(TS_WORKERS)]
+    for worker in workers:
+        worker.spawn(env)
+    http_client = new_http_client()
+    backend_ready = asyncio.Event()
+    run_in_background(wait_for_backend(started))
+    run_in_background(monitor_workers())
+    run_in_background(supervise_workers())
+    if PROXY_RATE_LIMIT_ENABLED:
+        run_in_background(sweep_rate_buckets())
+    if PROXY_WARMER_ENABLED and PROXY_CACHE_ENABLED:
+        run_in_background(cache_warmer.run())
+    if PROXY_CACHE_TAGS and PROXY_CACHE_ENABLED:
+        run_in_background(run_cache_invalidator())
+    if PROXY_WS_HUB:
+        run_in_background(run_ws_hub())
+    elif PROXY_WS_SNAPSHOTS:
+        run_in_background(run_snapshot_recorder())
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, begin_restart, 'SIGHUP')
+    except (NotImplementedError, RuntimeError):  # no signal support / not main thread
+        pass
+
+def new_http_client():
+    limits = httpx.Limits(
+        max_connections=PROXY_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=PROXY_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=PROXY_POOL_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(timeout=route_timeouts['default'], transport=UpstreamTransport(limits))
+
+def run_in_background(coro):
+    """Keep a strong reference to fire-and-forget tasks until they finish."""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+def mark_phase(started, phase):
+    readiness['phases'][phase] = round((time.monotonic() - started) * 1000, 1)
+
+async def tcp_listening(port):
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout=1.0)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    return True
+
+async def probe_worker(worker):
+    """Health-check one worker; returns True if it answered HTTP at all."""
+    try:
+        resp = await http_client.get(f"{worker.url}/api/health", timeout=2.0)
+    except httpx.TransportError:
+        worker.healthy = False
+        if worker.transport == 'uds' and not os.path.exists(worker.socket_path) and await tcp_listening(worker.port):
+            worker.use_tcp()
+        return False
+    try:
+        worker.healthy = resp.status_code == 200 and resp.json().get('ok') is True
+    except ValueError:
+        worker.healthy = False
+    if worker.healthy and worker.boot_ms is None and worker.started_at is not None:
+        worker.boot_ms = round((time.monotonic() - worker.started_at) * 1000, 1)
+        metrics.worker_boot_seconds.observe(worker.launch, value=worker.boot_ms / 1000)
+    return True
+
+async def wait_for_backend(started):
+    """
+    Poll /api/health with exponential backoff until a TS worker answers.
+    
+    Phases recorded: spawned -> listening (first HTTP answer) -> ready (health ok).
+    The gate opens as soon as one worker is healthy; the rest join through
+    monitor_workers(). Gives up when every process exits or READY_TIMEOUT
+    passes; either way the gate opens so queued requests stop waiting.
+    """
+    readiness['state'] = 'starting'
+    readiness['phases'] = {}
+    mark_phase(started, 'spawned')
+    
+    delay = READY_POLL_INITIAL
+    deadline = started + READY_TIMEOUT
+    while time.monotonic() < deadline:
+        if not any(worker.alive() for worker in workers):
+            readiness['state'] = 'failed'
+            codes = [worker.process and worker.process.returncode for worker in workers]
+            print(f"[Proxy] TS backend exited during startup (codes {codes})")
+            break
+        listening = await asyncio.gather(*(probe_worker(w) for w in workers if w.alive()))
+        if any(listening) and 'listening' not in readiness['phases']:
+            mark_phase(started, 'listening')
+        if any(worker.healthy for worker in workers):
+            mark_phase(started, 'ready')
+            readiness['state'] = 'ready'
+            print(f"[Proxy] TS backend ready via {workers[0].launch}: {readiness['phases']}")
+            break
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, READY_POLL_MAX)
+    else:
+        readiness['state'] = 'failed'
+        print(f"[Proxy] TS backend not ready after {READY_TIMEOUT}s")
+    
+    backend_ready.set()
+
+async def monitor_workers():
+    """
+    Periodic per-worker health checks.
+    
+    Polls quickly while a live worker is still unhealthy (e.g. replicas that
+    are still booting), otherwise every WORKER_HEALTH_INTERVAL seconds. A
+    backend that missed READY_TIMEOUT but comes up later is marked ready
+    here on its first healthy answer.
+    """
+    await backend_ready.wait()
+    while True:
+        await asyncio.gather(*(probe_worker(w) for w in workers if w.alive()))
+        for worker in workers:
+            if not worker.alive():
+                worker.healthy = False
+        if readiness['state'] == 'failed' and any(worker.healthy for worker in workers):
+            readiness['state'] = 'ready'
+            backend_ready.set()
+            print(f"[Proxy] TS backend ready after missing the {READY_TIMEOUT}s startup timeout")
+        booting = any(w.alive() and not w.healthy for w in workers)
+        await asyncio.sleep(READY_POLL_MAX if booting else WORKER_HEALTH_INTERVAL)
+
+recovering = set()  # workers the supervisor is currently respawning
+
+async def supervise_workers():
+    """Notice worker processes that exited on their own and respawn them."""
+    await backend_ready.wait()
+    while True:
+        for worker in workers:
+            if worker.process is not None and not worker.alive() and worker not in recovering:
+                recovering.add(worker)
+                run_in_background(recover_worker(worker))
+        await asyncio.sleep(SUPERVISOR_INTERVAL)
+
+async def recover_worker(worker):
+    """
+    Respawn one crashed worker after its backoff.
+    
+    Once it is healthy again the upstream pool is rebuilt (its keep-alive
+    connections to the dead process are useless) and, for the primary, the
+    hub reconnects straight away. Passthrough clients were already closed
+    with 1012 when their upstream socket dropped.
+    """
+    detected = time.monotonic()
+    code = worker.process.returncode
+    worker.healthy = False
+    worker.last_exit = code
+    metrics.worker_exits.inc(worker.index, code)
+    try:
+        if worker.started_at is not None and detected - worker.started_at >= SUPERVISOR_STABLE_SECONDS:
+            worker.backoff = 0
+        worker.crashes.append(detected)
+        while worker.crashes[0] < detected - CRASH_LOOP_WINDOW:
+            worker.crashes.popleft()
+        worker.crash_loop = len(worker.crashes) >= CRASH_LOOP_THRESHOLD
+        if worker.crash_loop:
+            delay = RESTART_BACKOFF_MAX
+        else:
+            delay = min(RESTART_BACKOFF_INITIAL * 2 ** worker.backoff, RESTART_BACKOFF_MAX)
+        worker.backoff += 1
+        state = 'crash loop, ' if worker.crash_loop else ''
+        print(f"[Proxy] TS worker {worker.index} (port {worker.port}) exited with code {code}; {state}restarting in {delay:.1f}s")
+        
+        await asyncio.sleep(delay)
+        if worker not in workers:
+            return  # replaced by a blue/green restart meanwhile
+        worker.spawn(backend_env())
+        if not await wait_for_workers([worker], time.monotonic() + READY_TIMEOUT):
+            return  # the next supervisor pass picks it up again if it died
+        
+        worker.restarts += 1
+        metrics.worker_restart_seconds.observe(value=time.monotonic() - detected)
+        print(f"[Proxy] TS worker {worker.index} back after {time.monotonic() - detected:.1f}s")
+        if readiness['state'] == 'failed':
+            readiness['state'] = 'ready'
+        run_in_background(rebuild_http_client())
+        if worker.primary and PROXY_WS_HUB:
+            ws_hub.wake.set()
+        if worker.primary:
+            cache_invalidator.wake.set()
+            ws_snapshots.wake.set()
+    finally:
+        recovering.discard(worker)
+
+async def rebuild_http_client():
+    """
+    Swap in a fresh upstream pool; the old one is closed once nothing is in flight on it.
+    
+    Heavy calls and streamed bodies can outlive RESTART_DRAIN_TIMEOUT, but
+    each one ends by itself (every read is bounded by its class timeout),
+    so there is no deadline here.
+    """
+    global http_client
+    old = http_client
+    http_client = new_http_client()
+    pool_stats.rebuilds += 1
+    while old._transport.in_flight():
+        await asyncio.sleep(1)
+    await old.aclose()
+
+def begin_restart(reason):
+    """Schedule a blue/green restart; False if one is already running."""
+    if restart_state['state'] != 'idle':
+        return False
+    restart_state['state'] = 'starting'
+    run_in_background(restart_backend(reason))
+    return True
+
+async def wait_for_workers(fresh, deadline):
+    """Poll a new worker set until every worker is healthy; False if one exits or time runs out."""
+    delay = READY_POLL_INITIAL
+    while time.monotonic() < deadline:
+        if not all(worker.alive() for worker in fresh):
+            return False
+        await asyncio.gather(*(probe_worker(w) for w in fresh))
+        if all(worker.healthy for worker in fresh):
+            return True
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, READY_POLL_MAX)
+    return False
+
+async def restart_backend(reason):
+    """
+    Blue/green restart of the TS worker set.
+    
+    The new set boots on the other port range while the current one keeps
+    serving. Once all of it passes /api/health, `workers` is swapped in a
+    single assignment, so new requests and WebSockets go to the new set and
+    the hub re-attaches to the new primary. The old set finishes its
+    in-flight requests (up to RESTART_DRAIN_TIMEOUT); its relayed
+    WebSockets are then closed with 1012 (service restart) so clients
+    reconnect, and it is stopped. The new worker 0 boots as a standby and
+    is promoted only after that, so the scheduler and Telegram polling never
+    run in two processes. If the new set fails, it is stopped and the old
+    one keeps serving.
+    """
+    global workers
+    started = time.monotonic()
+    generation = restart_state['generation'] + 1
+    base = TS_PORT + (TS_WORKERS if generation % 2 else 0)
+    fresh = [TsWorker(i, base + i) for i in range(TS_WORKERS)]
+    fresh[0].standby = True
+    print(f"[Proxy] Restart ({reason}): starting workers on ports {base}-{base + TS_WORKERS - 1}")
+    try:
+        if TS_BACKEND != 'standin' and TS_LAUNCH != 'tsx':
+            # A deploy may have changed the sources
+            await asyncio.to_thread(refresh_bundle, TS_LAUNCH == 'bundle')
+        env = backend_env()
+        for worker in fresh:
+            worker.spawn(env)
+        if not await wait_for_workers(fresh, started + READY_TIMEOUT):
+            restart_state['failed'] += 1
+            restart_state['last'] = {'reason': reason, 'ok': False, 'ms': round((time.monotonic() - started) * 1000, 1)}
+            print(f"[Proxy] Restart ({reason}) failed: new workers not healthy, keeping the current set")
+            await asyncio.gather(*(asyncio.to_thread(w.stop) for w in fresh))
+            return
+        
+        old = workers
+        for worker in old:
+            worker.draining = True
+        draining.extend(old)
+        workers = fresh
+        restart_state['generation'] = generation
+        restart_state['state'] = 'draining'
+        switched = time.monotonic()
+        if PROXY_WS_HUB:
+            await ws_hub.detach()
+        await cache_invalidator.detach()
+        await ws_snapshots.detach()
+        
+        deadline = switched + RESTART_DRAIN_TIMEOUT
+        while any(w.outstanding for w in old) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for worker in old:
+            for ts_ws in list(worker.sockets):
+                await ts_ws.close(code=1012)
+        await asyncio.gather(*(asyncio.to_thread(w.stop) for w in old))
+        for worker in old:
+            draining.remove(worker)
+        
+        restart_state['restarts'] += 1
+        restart_state['last'] = {
+            'reason': reason,
+            'ok': True,
+            'ms': round((time.monotonic() - started) * 1000, 1),
+            'drainMs': round((time.monotonic() - switched) * 1000, 1),
+        }
+        print(f"[Proxy] Restart ({reason}) done: {restart_state['last']}")
+    finally:
+        restart_state['state'] = 'idle'
+        if workers is fresh and fresh[0].standby:
+            # The old primary is stopped (or the drain failed part-way): hand over the jobs
+            await fresh[0].promote()
+
+def pick_worker():
+    """Least-outstanding-requests over healthy workers (ties: fewest served)."""
+    candidates = [w for w in workers if w.healthy]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda w: (w.outstanding, w.served))
+
+def primary_worker():
+    return workers[0] if workers else None
+
+async def fetch_upstream(method, target, headers, body=None):
+    """
+    Buffered round trip on the least-loaded worker.
+    
+    `target` is path plus query string. The body is read raw so the stored
+    bytes match the upstream Content-Encoding/Content-Length headers.
+    A GET body over BUFFER_MAX_BYTES is abandoned with TooLarge. Raises
+    BackendUnavailable, Overloaded, TooLarge or httpx transport errors.
+    """
+    worker = pick_worker()
+    if worker is None:
+        raise BackendUnavailable()
+    
+    upstream, kind = upstream_request(method, worker.url + target, headers, body)
+    admission = await admit(kind, metrics.route(upstream.url.path))
+    worker.outstanding += 1
+    worker.served += 1
+    try:
+        resp = await http_client.send(upstream, stream=True)
+        admission.settle(resp.status_code, resp.headers)
+        capped = method == 'GET'
+        try:
+            length = resp.headers.get('content-length', '')
+            if capped and length.isdigit() and int(length) > BUFFER_MAX_BYTES:
+                raise mark_oversized(target, metrics.route(upstream.url.path))
+            chunks = []
+            size = 0
+            async for chunk in resp.aiter_raw():
+                size += len(chunk)
+                if capped and size > BUFFER_MAX_BYTES:
+                    raise mark_oversized(target, metrics.route(upstream.url.path))
+                chunks.append(chunk)
+            raw = b''.join(chunks)
+        finally:
+            await resp.aclose()
+        metrics.upstream_responses.inc(metrics.route(upstream.url.path), resp.status_code)
+        return UpstreamReply(resp.status_code, response_headers(resp), raw)
+    except httpx.HTTPError as exc:
+        admission.settle(None)
+        if isinstance(exc, httpx.ConnectError):
+            worker.healthy = False
+        elif isinstance(exc, httpx.PoolTimeout):
+            pool_stats.classes[kind]['poolTimeouts'] += 1
+        raise
+    finally:
+        admission.release()
+        worker.outstanding -= 1
+
+async def client_disconnected(request: Request):
+    """Return once the client goes away; the request body must already be consumed."""
+    while (await request.receive())['type'] != 'http.disconnect':
+        pass
+
+async def unless_disconnected(request: Request, call):
+    """
+    Await an upstream call, cancelling it if the client disconnects first.
+    
+    Cancelling drops the upstream connection, which frees the pool slot and
+    tells the backend nobody is waiting. Raises ClientGone in that case.
+    """
+    task = asyncio.ensure_future(call)
+    watcher = asyncio.ensure_future(client_disconnected(request))
+    finished = False
+    try:
+        await asyncio.wait((task, watcher), return_when=asyncio.FIRST_COMPLETED)
+        finished = task.done()
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+    if not finished:
+        metrics.canceled.inc(metrics.route(request.url.path))
+        raise ClientGone()
+    return task.result()
+
+async def await_backend():
+    """
+    Hold a request until the backend is ready.
+    
+    Returns None when the request may proceed, or a 503 response when the
+    wait queue is full, the deadline passed, or startup failed.
+    """
+    if readiness['state'] == 'ready':
+        return None
+    if backend_ready is None or readiness['state'] == 'failed':
+        return JSONResponse(status_code=503, content={"error": "Backend unavailable"})
+    if readiness['waiting'] >= READY_QUEUE_LIMIT:
+        readiness['rejected'] += 1
+        return JSONResponse(status_code=503, content={"error": "Backend starting..."}, headers={"Retry-After": "1"})
+    
+    readiness['waiting'] += 1
+    try:
+        await asyncio.wait_for(backend_ready.wait(), timeout=READY_WAIT_TIMEOUT)
+    except asyncio.TimeoutError:
+        readiness['timedOut'] += 1
+        return JSONResponse(status_code=503, content={"error": "Backend starting..."}, headers={"Retry-After": "1"})
+    finally:
+        readiness['waiting'] -= 1
+    
+    if readiness['state'] != 'ready':
+        return JSONResponse(status_code=503, content={"error": "Backend unavailable"})
+    return None
 
 @app.on_event("shutdown")
 async def shutdown():
     global http_client
+    for task in list(background_tasks):
+        task.cancel()
     cleanup()
     if http_client:
         await http_client.aclose()
 
+@app.get("/proxy/ready")
+async def proxy_ready():
+    """Readiness probe plus startup-phase timings."""
+    return JSONResponse(
+        status_code=200 if readiness['state'] == 'ready' else 503,
+        content={
+            'ok': readiness['state'] == 'ready',
+            **readiness,
+            'workers': [worker.status() for worker in workers],
+            'draining': [worker.status() for worker in draining],
+            'restart': restart_state,
+            'launch': {'mode': TS_LAUNCH, 'bundle': bundle_state},
+        },
+    )
+
+@app.post("/proxy/restart")
+async def proxy_restart(request: Request):
+    """Start a blue/green restart of the TS backend (202), or 409 if one is running."""
+    if not PROXY_ADMIN_TOKEN:
+        # A loopback peer is no proof of a local caller behind a reverse proxy on the same host
+        return JSONResponse(status_code=404, content={"error": "Not Found", "message": "Set PROXY_ADMIN_TOKEN to enable /proxy/restart"})
+    if not hmac.compare_digest(request.headers.get('x-admin-token', ''), PROXY_ADMIN_TOKEN):
+        return JSONResponse(status_code=403, content={"error": "Forbidden"})
+    if not begin_restart('admin'):
+        return JSONResponse(status_code=409, content={"error": "Restart already in progress", "restart": restart_state})
+    return JSONResponse(status_code=202, content={'ok': True, 'restart': restart_state})
+
+@app.get("/proxy/cache")
+async def proxy_cache_status():
+    return {
+        'ok': True,
+        'enabled': PROXY_CACHE_ENABLED,
+        **response_cache.status(),
+        'etag': {'enabled': PROXY_ETAG, **etag_stats},
+        'singleFlight': {'enabled': PROXY_COALESCE_ENABLED, **single_flight.status()},
+        'warmer': cache_warmer.status(),
+        'tags': {**cache_invalidator.status(), 'taggedEntries': len(set().union(*response_cache.tags.values()))},
+        'writeThrough': write_through_stats,
+        'unbuffered': {'maxBytes': BUFFER_MAX_BYTES, 'oversizedTargets': len(oversized_targets)},
+    }
+
+@app.get("/proxy/pool")
+async def proxy_pool_status():
+    return {'ok': True, **pool_stats.status()}
+
+@app.get("/proxy/limits")
+async def proxy_limits_status():
+    """Adaptive concurrency limits, circuit breakers and per-user rate limits."""
+    return {
+        'ok': True,
+        'limiter': {'enabled': PROXY_LIMITER_ENABLED, 'classes': {name: l.status() for name, l in limiters.items()}},
+        'breakers': {'enabled': PROXY_BREAKER_ENABLED, 'routes': {route: b.status() for route, b in breakers.items()}},
+        'rateLimit': {'enabled': PROXY_RATE_LIMIT_ENABLED, **rate_limiter.status()},
+    }
+
+@app.get("/proxy/metrics")
+async def proxy_metrics():
+    """Prometheus text exposition of the proxy's counters, histograms and state."""
+    state = {
+        'workers': {
+            'healthy': sum(1 for w in workers if w.healthy),
+            'alive': sum(1 for w in workers if w.alive()),
+            'outstanding': sum(w.outstanding for w in workers),
+            'restarts': sum(w.restarts for w in workers),
+            'crashLooping': sum(1 for w in workers if w.crash_loop),
+        },
+        'readiness': {'ready': int(readiness['state'] == 'ready'), 'waiting': readiness['waiting']},
+        'pool': {k: v for k, v in pool_stats.snapshot().items()},
+        'cache': response_cache.status(),
+        'etag': etag_stats,
+        'singleflight': single_flight.status(),
+        'warmer': cache_warmer.status(),
+        'cache_tags': {k: v for k, v in cache_invalidator.status().items() if k != 'last'},
+        'ws_hub': {k: v for k, v in ws_hub.status().items() if k != 'enabled'},
+        'ws_queues': {k: v for k, v in send_queue_status().items() if k != 'policy'},
+        'ws_snapshots': {k: v for k, v in ws_snapshots.status().items() if k != 'ttl'},
+    }
+    for component, fields in state.items():
+        for field, value in fields.items():
+            metrics.gauges.set(component, field, value=int(value) if isinstance(value, bool) else value)
+    for name, limiter in limiters.items():
+        for field, value in limiter.status().items():
+            metrics.gauges.set(f'limiter_{name}', field, value=value or 0)
+    metrics.gauges.set('breakers', 'open', value=sum(1 for b in breakers.values() if b.state != 'closed'))
+    for name, stats in pool_stats.classes.items():
+        for field in ('requests', 'newConnections', 'reused', 'waitSeconds', 'poolTimeouts'):
+            metrics.gauges.set(f'pool_{name}', field, value=stats[field])
+    return Response(metrics.render(), media_type='text/plain; version=0.0.4')
+
+@app.get("/proxy/ws")
+async def proxy_ws_status():
+    return {'ok': True, **ws_hub.status(), 'sendQueues': send_queue_status(), 'snapshots': ws_snapshots.status()}
+
+def response_headers(resp):
+    return {k: v for k, v in resp.headers.items() if k.lower() not in HOP_HEADERS}
+
+def forward_headers(request: Request):
+    return {k: v for k, v in request.headers.items() if k.lower() not in ('host', 'content-length', DEADLINE_HEADER) + HOP_HEADERS}
+
+async def reply_response(request: Request, reply, cached=None, **extra_headers):
+    """
+    Response for a buffered reply, compressed when the client accepts it.
+    
+    `cached` is the (key, entry) a reply came from; compressed variants are
+    kept on the entry so repeated hits do not recompress. Successful GETs
+    carry an ETag and a matching If-None-Match gets an empty 304.
+    """
+    headers = {**reply.headers, **extra_headers}
+    etag = None
+    if PROXY_ETAG and request.method in ('GET', 'HEAD') and reply.status_code == 200:
+        etag = headers['etag'] = content_etag(reply)
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            etag_stats['notModified'] += 1
+            etag_stats['bytesSaved'] += len(reply.body)
+            return not_modified(headers)
+    encoding = None
+    if compressible(request.method, reply.status_code, reply.headers, len(reply.body)):
+        encoding = negotiate_encoding(request.headers.get('accept-encoding', ''))
+    if encoding is None:
+        return Response(content=reply.body, status_code=reply.status_code, headers=headers)
+    
+    body = cached[1].variants.get(encoding) if cached else None
+    if body is None:
+        body = await compress_body(reply.body, encoding)
+        if cached:
+            response_cache.add_variant(cached[0], cached[1], encoding, body)
+    if etag is not None:
+        headers['etag'] = variant_etag(etag, encoding)
+    return Response(content=body, status_code=reply.status_code, headers=encoded_headers(headers, encoding, len(body)))
+
+def not_modified(headers):
+    headers = {k: v for k, v in headers.items() if k.lower() not in ('content-length', 'content-type', 'content-encoding')}
+    return Response(status_code=304, headers=headers)
+
+def backend_unavailable():
+    return JSONResponse(status_code=503, content={"error": "Backend unavailable"}, headers={"Retry-After": "1"})
+
+def upstream_error(exc):
+    """Map a failed upstream round trip to the response the client gets."""
+    if isinstance(exc, ClientGone):
+        return Response(status_code=499)  # nobody reads it; recorded as client closed request
+    if isinstance(exc, BackendUnavailable):
+        return backend_unavailable()
+    if isinstance(exc, Overloaded):
+        return JSONResponse(status_code=503, content={"error": "Overloaded", "reason": exc.reason}, headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))})
+    if isinstance(exc, httpx.PoolTimeout):
+        return JSONResponse(status_code=503, content={"error": "Upstream pool exhausted"}, headers={"Retry-After": "1"})
+    if isinstance(exc, httpx.TimeoutException):
+        return JSONResponse(status_code=504, content={"error": "Upstream timeout"})
+    if isinstance(exc, httpx.ConnectError):
+        return JSONResponse(status_code=503, content={"error": "Backend starting..."})
+    return JSONResponse(status_code=502, content={"error": "Bad gateway"})
+
+def batch_items(payload):
+    """
+    Validate a batch body into [(id, path, query)].
+    
+    Accepts {"requests": [...]} or a bare list; each entry is a path string
+    or {"id": ..., "path": ...}. Raises ValueError with the client message.
+    """
+    entries = payload.get('requests') if isinstance(payload, dict) else payload
+    if not isinstance(entries, list) or not entries:
+        raise ValueError('Expected a non-empty "requests" list')
+    if len(entries) > BATCH_MAX_REQUESTS:
+        raise ValueError(f'At most {BATCH_MAX_REQUESTS} requests per batch')
+    items = []
+    for index, entry in enumerate(entries):
+        if isinstance(entry, str):
+            entry = {'path': entry}
+        target = entry.get('path') if isinstance(entry, dict) else None
+        if not isinstance(target, str) or not target.startswith('/api/') or target.split('?')[0].rstrip('/') == '/api/batch':
+            raise ValueError(f'requests[{index}]: path must be an /api/ GET path')
+        path, _, query = target.partition('?')
+        items.append((str(entry.get('id', index)), path, query))
+    return items
+
+def batch_body(reply):
+    """Sub-response body as JSON when it parses, else text."""
+    body = reply.body
+    encoding = reply.headers.get('content-encoding', 'identity').lower()
+    try:
+        if encoding in ('gzip', 'deflate'):
+            body = zlib.decompress(body, 47)  # gzip or zlib header
+        elif encoding == 'br' and brotli is not None:
+            body = brotli.decompress(body)
+    except (zlib.error, brotli.error if brotli is not None else zlib.error):
+        return {'error': f'Undecodable {encoding} body'}
+    try:
+        return json.loads(body)
+    except ValueError:
+        return body.decode('utf-8', errors='replace')
+
+async def batch_get(item, headers, limit):
+    """Run one batch entry; always returns {id, status, body}."""
+    id, path, query = item
+    if rate_limit_wait(headers.get('x-user-id'), 'GET', path):
+        return {'id': id, 'status': 429, 'body': {'error': 'Too many requests'}}
+    target = f"{path}?{query}" if query else path
+    rule = match_cache_rule(path) if PROXY_CACHE_ENABLED else None
+    async with limit:
+        try:
+            if rule is not None:
+                reply = (await cached_fetch(path, query, target, rule, headers))[0]
+            elif PROXY_COALESCE_ENABLED and match_coalesce_route(path):
+                reply = await fetch_coalesced('GET', target, headers)
+            else:
+                reply = await fetch_upstream('GET', target, headers)
+        except TooLarge:
+            return {'id': id, 'status': 413, 'body': {'error': 'Response too large to batch; request it directly'}}
+        except (BackendUnavailable, Overloaded, httpx.HTTPError) as exc:
+            error = upstream_error(exc)
+            return {'id': id, 'status': error.status_code, 'body': json.loads(error.body)}
+    return {'id': id, 'status': reply.status_code, 'body': batch_body(reply)}
+
+@app.post("/api/batch")
+async def batch(request: Request):
+    """
+    Fan several GETs out upstream, at most BATCH_CONCURRENCY at a time.
+    
+    The default reply is {"ok": true, "responses": [...]} in request order.
+    With ?stream=1 (or Accept: application/x-ndjson) each result is written
+    as one NDJSON line as soon as it is ready, in completion order.
+    """
+    try:
+        payload = json.loads(await request.body() or b'null')
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": "Invalid JSON body"})
+    try:
+        items = batch_items(payload)
+    except ValueError as exc:
+        return JSONResponse(status_code=400, content={"error": str(exc)})
+    
+    blocked = await await_backend()
+    if blocked is not None:
+        return blocked
+    
+    # Sub-requests carry the caller's identity but are plain, uncompressed GETs
+    headers = unconditional(forward_headers(request))
+    headers.pop('content-type', None)
+    headers['accept-encoding'] = 'identity'
+    limit = asyncio.Semaphore(BATCH_CONCURRENCY)
+    tasks = [asyncio.ensure_future(batch_get(item, headers, limit)) for item in items]
+    
+    stream = request.query_params.get('stream') in ('1', 'true') or 'application/x-ndjson' in request.headers.get('accept', '')
+    if not stream:
+        started = time.monotonic()
+        try:
+            responses = await unless_disconnected(request, asyncio.gather(*tasks))
+        except ClientGone as exc:
+            return upstream_error(exc)
+        finally:
+            for task in tasks:
+                task.cancel()
+            observe_upstream(request, time.monotonic() - started)
+        return await reply_response(request, UpstreamReply(200, {'content-type': 'application/json'}, json.dumps({'ok': True, 'responses': responses}).encode()))
+    
+    async def lines():
+        try:
+            for result in asyncio.as_completed(tasks):
+                yield json.dumps(await result).encode() + b'\n'
+        finally:
+            # Client went away (or the stream finished): stop outstanding fetches
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(lines(), media_type='application/x-ndjson', headers={'cache-control': 'no-store'})
+
 # Proxy all API requests to TypeScript
 @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"])
 async def proxy(request: Request, path: str):
-    url = f"{TS_URL}/{path}"
+    limited = rate_limited(request, f"/{path}")
+    if limited is not None:
+        return limited
+    
+    blocked = await await_backend()
+    if blocked is not None:
+        return blocked
+    
+    target = f"/{path}"
     if request.url.query:
-        url += f"?{request.url.query}"
+        target += f"?{request.url.query}"
+    
+    if request.method == 'GET' and not known_oversized(target):
+        rule = match_cache_rule(f"/{path}") if PROXY_CACHE_ENABLED else None
+        if rule is not None:
+            return await proxy_cached(request, path, target, rule)
+        if PROXY_COALESCE_ENABLED and match_coalesce_route(f"/{path}"):
+            return await proxy_coalesced(request, target)
+    
+    user = request.headers.get('x-user-id', '')
+    if PROXY_STREAMING:
+        return write_through(request.method, f"/{path}", user, await proxy_streaming(request, target))
     
     body = await request.body()
-    headers = {k: v for k, v in request.headers.items() if k.lower() not in ('host', 'content-length')}
-    
-    try:
-        resp = await http_client.request(
-            method=request.method,
-            url=url,
-            content=body or None,
-            headers=headers,
-        )
-        return Response(
-            content=resp.content,
-            status_code=resp.status_code,
-            headers={k: v for k, v in resp.headers.items() if k.lower() not in ('transfer-encoding', 'connection')},
-        )
-    except httpx.ConnectError:
-        return JSONResponse(status_code=503, content={"error": "Backend starting..."})
+    started = time.monotonic()
+    try:
+        reply = await unless_disconnected(request, fetch_upstream(request.method, target, forward_headers(request), body or None))
+    except TooLarge:
+        return await proxy_streaming(request, target)
+    except (BackendUnavailable, Overloaded, ClientGone, httpx.HTTPError) as exc:
+        return upstream_error(exc)
+    finally:
+        observe_upstream(request, time.monotonic() - started)
+    return write_through(request.method, f"/{path}", user, await reply_response(request, reply))
+
+async def fetch_coalesced(method, target, headers, generation=None):
+    """
+    fetch_upstream() through single-flight (a plain fetch when coalescing is off).
+    
+    `generation` joins the key: tagged fills pass their tags' purge epoch so
+    a read after a purge (e.g. the caller's own write) never joins a flight
+    that started before it.
+    """
+    if not PROXY_COALESCE_ENABLED:
+        return await fetch_upstream(method, target, headers)
+    key = (method, target, generation) + tuple(headers.get(name, '') for name in COALESCE_HEADERS)
+    return await single_flight.do(key, lambda: fetch_upstream(method, target, headers))
+
+async def proxy_coalesced(request: Request, target):
+    started = time.monotonic()
+    try:
+        reply = await unless_disconnected(request, fetch_coalesced('GET', target, unconditional(forward_headers(request))))
+    except TooLarge:
+        return await proxy_streaming(request, target)
+    except (BackendUnavailable, Overloaded, ClientGone, httpx.HTTPError) as exc:
+        return upstream_error(exc)
+    finally:
+        observe_upstream(request, time.monotonic() - started)
+    return await reply_response(request, reply)
+
+def cache_key(path, query, user, vary_user):
+    query = urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+    return f"{path}?{query}|{user if vary_user else ''}"
+
+def cacheable(reply):
+    cache_control = reply.headers.get('cache-control', '').lower()
+    return reply.status_code == 200 and 'set-cookie' not in reply.headers and 'no-store' not in cache_control
+
+async def cached_fetch(path, query, target, rule, headers):
+    """
+    Reply for a cacheable GET, from memory when possible.
+    
+    Fresh entries are returned as-is; stale ones are returned immediately
+    while a single background refresh per key re-fills them. Fills ask the
+    backend for an identity encoding so one stored body fits every client.
+    Returns (reply, 'HIT' | 'STALE' | 'MISS', (key, entry) or None); raises
+    like fetch_upstream().
+    """
+    template, ttl, swr, vary_user, tags = rule
+    user = headers.get('x-user-id', '')
+    key = cache_key(path, query, user, vary_user)
+    tags = user_tags(tags, user)
+    entry, state = response_cache.get(key)
+    if entry is not None:
+        if state == 'stale' and key not in response_cache.refreshing:
+            run_in_background(refresh_cache_entry(key, entry))
+        return entry.reply, 'HIT' if state == 'fresh' else 'STALE', (key, entry)
+    
+    headers = {**unconditional(headers), 'accept-encoding': 'identity'}
+    epoch = response_cache.epoch
+    reply = await fetch_coalesced('GET', target, headers, response_cache.purge_epoch(tags) if tags else None)
+    cached = None
+    if cacheable(reply):
+        cached = (key, CacheEntry(reply, entry_ttl(ttl, tags), swr, target, headers, tags))
+        response_cache.put(*cached, epoch)
+    return reply, 'MISS', cached
+
+async def proxy_cached(request: Request, path, target, rule):
+    started = time.monotonic()
+    try:
+        reply, state, cached = await unless_disconnected(request, cached_fetch(f"/{path}", request.url.query, target, rule, forward_headers(request)))
+    except TooLarge:
+        return await proxy_streaming(request, target)
+    except (BackendUnavailable, Overloaded, ClientGone, httpx.HTTPError) as exc:
+        return upstream_error(exc)
+    finally:
+        observe_upstream(request, time.monotonic() - started)
+    extra = {'x-proxy-cache': state}
+    if state != 'MISS':
+        extra['age'] = str(int(cached[1].age()))
+    return await reply_response(request, reply, cached=cached, **extra)
+
+async def refresh_cache_entry(key, entry):
+    """
+    Re-fill a stale entry, conditionally when ETags are on.
+    
+    A 304, or a 200 whose body hashes the same, only renews the entry so
+    its compressed variants survive.
+    """
+    response_cache.refreshing.add(key)
+    epoch = response_cache.epoch
+    try:
+        headers = entry.fill_headers
+        if PROXY_ETAG:
+            headers = {**headers, 'if-none-match': content_etag(entry.reply)}
+        reply = await fetch_upstream('GET', entry.fill_target, headers)
+        if PROXY_ETAG and (reply.status_code == 304 or (reply.status_code == 200 and content_etag(reply) == content_etag(entry.reply))):
+            response_cache.renew(key, entry, epoch)
+            etag_stats['revalidated'] += 1
+        elif cacheable(reply):
+            response_cache.put(key, CacheEntry(reply, entry.ttl, entry.swr, entry.fill_target, entry.fill_headers, entry.tags), epoch)
+            response_cache.stats['refreshes'] += 1
+    except TooLarge:
+        if response_cache.entries.get(key) is entry:
+            response_cache.pop(key)
+    except (BackendUnavailable, Overloaded, httpx.HTTPError):
+        pass
+    finally:
+        response_cache.refreshing.discard(key)
+
+class CacheWarmer:
+    """
+    Re-fill cache entries for the most active tokens before anyone asks.
+    
+    Each pass reads WARM_SOURCE, then for the top WARM_TOP_N tokens
+    revalidates entries that would go stale before the next pass and fills
+    missing ones, WARM_CONCURRENCY at a time. Warm requests count against
+    the adaptive limiter like any other; while a limiter is more than
+    WARM_LOAD_THRESHOLD used, or a warm request is shed, the pass stops and
+    the interval doubles up to WARM_MAX_INTERVAL.
+    """
+    
+    headers = {'accept-encoding': 'identity'}
+    
+    def __init__(self):
+        self.interval = WARM_INTERVAL
+        self.tokens = []
+        self.stats = {'passes': 0, 'filled': 0, 'revalidated': 0, 'warm': 0, 'errors': 0, 'backoffs': 0}
+    
+    def busy(self):
+        return PROXY_LIMITER_ENABLED and any(l.in_flight > l.limit * WARM_LOAD_THRESHOLD for l in limiters.values())
+    
+    async def warm(self, target):
+        """Make sure `target` will still be fresh at the next pass; False if it backed off."""
+        path, _, query = target.partition('?')
+        rule = match_cache_rule(path)
+        if rule is None:
+            return True
+        template, ttl, swr, vary_user, tags = rule
+        key = cache_key(path, query, '', vary_user)
+        entry = response_cache.entries.get(key)
+        if entry is not None and entry.ttl - entry.age() > self.interval:
+            self.stats['warm'] += 1
+            return True
+        if self.busy():
+            return False
+        if entry is not None and entry.age() < entry.ttl + entry.swr:
+            if key not in response_cache.refreshing:
+                await refresh_cache_entry(key, entry)
+                self.stats['revalidated'] += 1
+            return True
+        epoch = response_cache.epoch
+        try:
+            reply = await fetch_coalesced('GET', target, self.headers, response_cache.purge_epoch(tags) if tags else None)
+        except Overloaded:
+            return False
+        except (BackendUnavailable, TooLarge, httpx.HTTPError):
+            self.stats['errors'] += 1
+            return True
+        if cacheable(reply):
+            response_cache.put(key, CacheEntry(reply, entry_ttl(ttl, tags), swr, target, self.headers, tags), epoch)
+            self.stats['filled'] += 1
+        return True
+    
+    def top_tokens(self):
+        path, _, query = WARM_SOURCE.partition('?')
+        entry = response_cache.entries.get(cache_key(path, query, '', False))
+        if entry is None:
+            return self.tokens
+        try:
+            tokens = json.loads(entry.reply.body)['data']['tokens']
+            return [t['address'] for t in tokens[:WARM_TOP_N] if t.get('address')]
+        except (ValueError, KeyError, TypeError):
+            return self.tokens
+    
+    async def run_pass(self):
+        self.stats['passes'] += 1
+        if not await self.warm(WARM_SOURCE):
+            return False
+        self.tokens = self.top_tokens()
+        targets = [t.replace('{addr}', addr) for addr in self.tokens for t in WARM_TARGETS]
+        limit = asyncio.Semaphore(WARM_CONCURRENCY)
+        backed_off = False
+        
+        async def warm_one(target):
+            nonlocal backed_off
+            async with limit:
+                if not backed_off and not await self.warm(target):
+                    backed_off = True
+        
+        await asyncio.gather(*(warm_one(t) for t in targets))
+        return not backed_off
+    
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if readiness['state'] != 'ready':
+                continue
+            try:
+                ok = await self.run_pass()
+            except Exception as exc:
+                print(f"[Proxy] Cache warmer pass failed: {exc!r}")
+                ok = True
+            if ok:
+                self.interval = WARM_INTERVAL
+            else:
+                self.interval = min(WARM_MAX_INTERVAL, self.interval * 2)
+                self.stats['backoffs'] += 1
+    
+    def status(self):
+        return {
+            'enabled': PROXY_WARMER_ENABLED and PROXY_CACHE_ENABLED,
+            'intervalSeconds': self.interval,
+            'tokens': len(self.tokens),
+            **self.stats,
+        }
+
+cache_warmer = CacheWarmer()
+
+class CacheInvalidator:
+    """Purge tagged cache entries when the primary worker reports a finished job."""
+    
+    def __init__(self):
+        self.connected = False
+        self.upstream = None
+        self.wake = asyncio.Event()  # set to skip the reconnect backoff
+        self.last = None
+        self.stats = {'jobEvents': 0, 'purges': 0, 'purgedEntries': 0, 'reconnects': 0}
+    
+    def handle(self, text):
+        try:
+            event = json.loads(text)
+        except ValueError:
+            return
+        if not isinstance(event, dict) or event.get('type') != 'job.completed':
+            return
+        self.stats['jobEvents'] += 1
+        tags = JOB_TAGS.get(event.get('job'))
+        if tags:
+            self.purge(tags, event['job'])
+    
+    def purge(self, tags, reason):
+        purged = response_cache.purge(tags)
+        self.stats['purges'] += 1
+        self.stats['purgedEntries'] += purged
+        self.last = {'reason': reason, 'tags': list(tags), 'entries': purged, 'at': time.time()}
+    
+    async def detach(self):
+        """Drop the upstream socket so run_cache_invalidator() reconnects to the current primary."""
+        if self.upstream is not None:
+            await self.upstream.close(code=1012)
+    
+    def status(self):
+        return {'enabled': PROXY_CACHE_TAGS, 'connected': self.connected, 'taggedTtl': CACHE_TAGGED_TTL, **self.stats, 'last': self.last}
+
+cache_invalidator = CacheInvalidator()
+
+async def run_cache_invalidator():
+    """Follow job.completed events on the primary worker's /ws, reconnecting with backoff."""
+    await backend_ready.wait()
+    delay = READY_POLL_INITIAL
+    while True:
+        worker = primary_worker()
+        try:
+            async with worker.ws_connect() as ts_ws:
+                cache_invalidator.upstream = ts_ws
+                await ts_ws.send(json.dumps({'type': 'hello', 'subscriptions': ['jobs']}))
+                cache_invalidator.connected = True
+                delay = READY_POLL_INITIAL
+                async for msg in ts_ws:
+                    cache_invalidator.handle(msg if isinstance(msg, str) else msg.decode())
+        except (OSError, websockets.WebSocketException):
+            pass
+        finally:
+            cache_invalidator.upstream = None
+            if cache_invalidator.connected:
+                # Entries stored under the long ttl can no longer be trusted
+                cache_invalidator.connected = False
+                cache_invalidator.purge(list(response_cache.tags), 'disconnected')
+        cache_invalidator.stats['reconnects'] += 1
+        try:
+            await asyncio.wait_for(cache_invalidator.wake.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+        cache_invalidator.wake.clear()
+        delay = min(delay * 2, READY_POLL_MAX * 5)
+
+async def proxy_streaming(request: Request, target):
+    """
+    Pass bodies through chunk by chunk in both directions.
+    
+    Content-Length is kept when the client sent one so httpx forwards it
+    instead of switching to chunked encoding. The upstream body is relayed
+    raw (still encoded), so its Content-Encoding/Content-Length stay valid.
+    The worker's outstanding count is released once the body is done.
+    Small GET bodies are buffered instead so they can carry an ETag.
+    """
+    worker = pick_worker()
+    if worker is None:
+        return backend_unavailable()
+    
+    has_body = 'content-length' in request.headers or 'transfer-encoding' in request.headers
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in ('host', DEADLINE_HEADER) + HOP_HEADERS}
+    
+    upstream, kind = upstream_request(request.method, worker.url + target, headers, request.stream() if has_body else None)
+    try:
+        admission = await admit(kind, metrics.route(upstream.url.path))
+    except Overloaded as exc:
+        return upstream_error(exc)
+    worker.outstanding += 1
+    worker.served += 1
+    started = time.monotonic()
+    try:
+        if has_body:
+            resp = await http_client.send(upstream, stream=True)
+        else:
+            # The request body is done, so the client's next message can only be a disconnect
+            resp = await unless_disconnected(request, http_client.send(upstream, stream=True))
+    except ClientGone as exc:
+        observe_upstream(request, time.monotonic() - started)
+        admission.release()
+        worker.outstanding -= 1
+        return upstream_error(exc)
+    except httpx.HTTPError as exc:
+        observe_upstream(request, time.monotonic() - started)
+        admission.settle(None)
+        worker.outstanding -= 1
+        if isinstance(exc, httpx.ConnectError):
+            worker.healthy = False
+        elif isinstance(exc, httpx.PoolTimeout):
+            pool_stats.classes[kind]['poolTimeouts'] += 1
+        return upstream_error(exc)
+    except BaseException:
+        admission.release()
+        worker.outstanding -= 1
+        raise
+    
+    # The slot covers the backend's work, which is done once headers arrive
+    admission.settle(resp.status_code, resp.headers)
+    observe_upstream(request, time.monotonic() - started)
+    metrics.upstream_responses.inc(metrics.route(upstream.url.path), resp.status_code)
+    released = False
+    
+    async def release():
+        nonlocal released
+        if not released:
+            released = True
+            worker.outstanding -= 1
+            await resp.aclose()
+    
+    async def relay():
+        # Only the time blocked on the next upstream chunk counts as upstream
+        chunks = resp.aiter_raw()
+        try:
+            while True:
+                waited = time.monotonic()
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    observe_upstream(request, time.monotonic() - waited)
+                yield chunk
+        finally:
+            await release()
+    
+    headers = response_headers(resp)
+    length = int(headers['content-length']) if headers.get('content-length', '').isdigit() else None
+    if PROXY_ETAG and request.method == 'GET' and resp.status_code == 200 and length is not None and length <= ETAG_MAX_BYTES:
+        # Small enough to buffer: hash it so the client can revalidate
+        try:
+            raw = b''.join([chunk async for chunk in relay()])
+        except httpx.HTTPError as exc:
+            return upstream_error(exc)
+        return await reply_response(request, UpstreamReply(resp.status_code, headers, raw))
+    
+    body = relay()
+    if compressible(request.method, resp.status_code, headers, length):
+        encoding = negotiate_encoding(request.headers.get('accept-encoding', ''))
+        if encoding is not None:
+            headers = encoded_headers(headers, encoding)
+            body = compress_stream(body, encoding)
+    
+    return StreamingResponse(
+        body,
+        status_code=resp.status_code,
+        headers=headers,
+        background=BackgroundTask(release),
+    )
+
+SNAPSHOT_ID_FIELDS = ('dedupKey', 'alertId', 'signalId', 'subjectId', 'input')
+
+def state_channel(message):
+    """The state a frame is the latest value of: its channel, else category:entity id; None if it names neither."""
+    if message.get('channel'):
+        return message['channel']
+    entity = next((message[field] for field in SNAPSHOT_ID_FIELDS if message.get(field)), None)
+    if entity is None:
+        return None
+    return f"{event_category(message.get('type') or '')}:{entity}"
+
+def frame_channel(text):
+    """Conflation key of a frame (state_channel()), or None for frames that must never be conflated."""
+    try:
+        message = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(message, dict):
+        return None
+    return state_channel(message)
+
+class SendQueue:
+    """
+    Bounded outbound frames for one client; put() never blocks the producer.
+    
+    When full, 'drop-oldest' discards the oldest frame; 'conflate' first
+    keeps only the newest queued frame per channel or entity (frame_channel;
+    frames naming neither, e.g. distinct events, are never merged) and drops
+    the oldest if that did not free room; 'disconnect' stops the queue so
+    the writer closes the client with 1013 (try again later).
+    """
+    
+    def __init__(self, maxsize=WS_SEND_QUEUE_MAX, policy=WS_OVERFLOW_POLICY):
+        self.maxsize = maxsize
+        self.policy = policy
+        self.frames = deque()
+        self.ready = asyncio.Event()
+        self.overflowed = False
+        self.dropped = 0
+    
+    def put(self, text):
+        if self.overflowed:
+            return
+        if len(self.frames) >= self.maxsize:
+            if self.policy == 'disconnect':
+                self.overflowed = True
+                self.dropped += len(self.frames) + 1
+                metrics.ws_dropped.inc('disconnect', value=len(self.frames) + 1)
+                self.frames.clear()
+                self.ready.set()
+                return
+            if self.policy == 'conflate':
+                self.conflate()
+            while len(self.frames) >= self.maxsize:
+                self.frames.popleft()
+                self.dropped += 1
+                metrics.ws_dropped.inc('oldest')
+        self.frames.append(text)
+        self.ready.set()
+    
+    def conflate(self):
+        latest = {}
+        for index, text in enumerate(self.frames):
+            latest[frame_channel(text) or index] = index
+        keep = set(latest.values())
+        superseded = len(self.frames) - len(keep)
+        if superseded:
+            self.frames = deque(text for index, text in enumerate(self.frames) if index in keep)
+            self.dropped += superseded
+            metrics.ws_dropped.inc('conflated', value=superseded)
+    
+    async def get(self):
+        """Next frame, or None once the queue overflowed under 'disconnect'."""
+        while not self.frames:
+            if self.overflowed:
+                return None
+            self.ready.clear()
+            await self.ready.wait()
+        return self.frames.popleft()
+
+send_queues = set()
+
+async def write_queue(websocket: WebSocket, queue):
+    """Send queued frames until the socket fails; closes it with 1013 on a 'disconnect' overflow."""
+    send_queues.add(queue)
+    try:
+        while True:
+            text = await queue.get()
+            if text is None:
+                await websocket.close(code=1013)
+                return
+            await websocket.send_text(text)
+            metrics.ws_messages.inc('out')
+    except Exception:
+        pass
+    finally:
+        send_queues.discard(queue)
+
+def send_queue_status():
+    depths = [len(q.frames) for q in send_queues]
+    return {
+        'policy': WS_OVERFLOW_POLICY,
+        'maxSize': WS_SEND_QUEUE_MAX,
+        'queues': len(depths),
+        'depth': sum(depths),
+        'maxDepth': max(depths, default=0),
+    }
+
+class SnapshotStore:
+    """
+    Last frame per channel with its event category, so a new subscriber gets
+    current state from memory instead of waiting for the next broadcast.
+    
+    LRU bounded to max_entries channels; replay() skips and drops frames
+    older than ttl. Control frames, frames naming no channel or entity id
+    and categories outside WS_SNAPSHOT_CATEGORIES are never kept. Frames are
+    stored re-encoded with "replayed": true so clients can tell them from
+    live events.
+    """
+    
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.frames = OrderedDict()  # channel -> (category, text, stored)
+        self.connected = False
+        self.upstream = None  # passthrough mode's recorder socket
+        self.wake = asyncio.Event()  # set to skip the recorder's reconnect backoff
+        self.stats = {'stores': 0, 'evictions': 0, 'expired': 0, 'replays': 0, 'replayed': 0}
+    
+    def record(self, text, message=None):
+        if not PROXY_WS_SNAPSHOTS:
+            return
+        if message is None:
+            try:
+                message = json.loads(text)
+            except ValueError:
+                return
+        if not isinstance(message, dict):
+            return
+        event_type = message.get('type') or ''
+        if event_type in ('connected', 'pong'):
+            return
+        category = event_category(event_type)
+        if category not in WS_SNAPSHOT_CATEGORIES:
+            return
+        channel = state_channel(message)
+        if channel is None:
+            return  # no way to tell which state it is the last value of
+        self.frames.pop(channel, None)
+        self.frames[channel] = (category, json.dumps({**message, 'replayed': True}), time.monotonic())
+        self.stats['stores'] += 1
+        while len(self.frames) > self.max_entries:
+            self.frames.popitem(last=False)
+            self.stats['evictions'] += 1
+    
+    def replay(self, queue, categories):
+        """Queue the live snapshots of `categories` (empty = every category but jobs), oldest first."""
+        if not PROXY_WS_SNAPSHOTS or not self.frames:
+            return 0
+        cutoff = time.monotonic() - self.ttl
+        expired = [channel for channel, (_, _, stored) in self.frames.items() if stored < cutoff]
+        for channel in expired:
+            del self.frames[channel]
+        self.stats['expired'] += len(expired)
+        sent = 0
+        for category, text, _ in self.frames.values():
+            if category in categories or (not categories and category != 'jobs'):
+                queue.put(text)
+                sent += 1
+        self.stats['replays'] += 1
+        self.stats['replayed'] += sent
+        return sent
+    
+    async def detach(self):
+        """Drop the recorder socket so run_snapshot_recorder() reconnects to the current primary."""
+        if self.upstream is not None:
+            await self.upstream.close(code=1012)
+    
+    def status(self):
+        return {
+            'enabled': PROXY_WS_SNAPSHOTS,
+            'recorderConnected': self.connected,
+            'channels': len(self.frames),
+            'maxChannels': self.max_entries,
+            'ttl': self.ttl,
+            **self.stats,
+        }
+
+ws_snapshots = SnapshotStore(WS_SNAPSHOT_MAX, WS_SNAPSHOT_TTL)
+
+async def run_snapshot_recorder():
+    """Passthrough mode: record snapshots from one socket on the primary instead of every client's."""
+    await backend_ready.wait()
+    delay = READY_POLL_INITIAL
+    while True:
+        worker = primary_worker()
+        try:
+            async with worker.ws_connect(max_size=None) as ts_ws:
+                ws_snapshots.upstream = ts_ws
+                await ts_ws.send(json.dumps({'type': 'hello', 'subscriptions': sorted(WS_SNAPSHOT_CATEGORIES)}))
+                ws_snapshots.connected = True
+                delay = READY_POLL_INITIAL
+                async for msg in ts_ws:
+                    ws_snapshots.record(msg if isinstance(msg, str) else msg.decode())
+        except (OSError, websockets.WebSocketException):
+            pass
+        finally:
+            ws_snapshots.upstream = None
+            ws_snapshots.connected = False
+        try:
+            await asyncio.wait_for(ws_snapshots.wake.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+        ws_snapshots.wake.clear()
+        delay = min(delay * 2, READY_POLL_MAX * 5)
+
+def requested_categories(data):
+    """Categories a client hello / subscribe asks for (empty set = all), else None."""
+    try:
+        message = json.loads(data)
+    except ValueError:
+        return None
+    if not isinstance(message, dict):
+        return None
+    kind = message.get('type')
+    if kind == 'hello' and isinstance(message.get('subscriptions'), list):
+        return set(message['subscriptions'])
+    if kind == 'subscribe' and message.get('category'):
+        return {message['category']}
+    return None
 
 # WebSocket proxy
 @app.websocket("/ws")
 async def ws_proxy(websocket: WebSocket):
     await websocket.accept()
+    if await await_backend() is not None:
+        await websocket.close(code=1013)
+        return
+    metrics.ws_connections_total.inc()
+    metrics.ws_connections.inc()
+    try:
+        if PROXY_WS_HUB:
+            await ws_hub_client(websocket)
+        else:
+            await ws_passthrough(websocket)
+    finally:
+        metrics.ws_connections.inc(value=-1)
+
+async def ws_passthrough(websocket: WebSocket):
+    """
+    One upstream socket per client, relaying frames both ways.
+    
+    Upstream frames go through the client's SendQueue, so a slow client
+    never holds up reading from the backend. A hello / subscribe from the
+    client is forwarded and then answered with the matching snapshots
+    (recorded by run_snapshot_recorder()). Ends when either side closes. When the upstream side went away (worker
+    drained by a restart, or crashed) the client is closed with 1012
+    (service restart) so it reconnects.
+    """
+    worker = primary_worker()
+    queue = SendQueue()
+    code = 1000
     try:
-        async with websockets.connect(f"ws://127.0.0.1:{TS_PORT}/ws") as ts_ws:
+        async with worker.ws_connect() as ts_ws:
             async def to_client():
                 async for msg in ts_ws:
-                    await websocket.send_text(msg)
+                    queue.put(msg if isinstance(msg, str) else msg.decode())
             async def to_backend():
                 while True:
                     data = await websocket.receive_text()
+                    metrics.ws_messages.inc('in')
                     await ts_ws.send(data)
-            await asyncio.gather(to_client(), to_backend(), return_exceptions=True)
+                    categories = requested_categories(data)
+                    if categories is not None:
+                        ws_snapshots.replay(queue, categories)
+            worker.sockets.add(ts_ws)
+            relays = [
+                asyncio.ensure_future(to_client()),
+                asyncio.ensure_future(to_backend()),
+                asyncio.ensure_future(write_queue(websocket, queue)),
+            ]
+            try:
+                done, _ = await asyncio.wait(relays, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                worker.sockets.discard(ts_ws)
+                for relay in relays:
+                    relay.cancel()
+            if relays[0] in done:
+                code = 1012
+            elif queue.overflowed:
+                code = 1013
     except:
         pass
     finally:
+        try:
+            await websocket.close(code=code)
+        except:
+            pass
+
+# WebSocket hub mode (PROXY_WS_HUB=true)
+#
+# Mirrors the client protocol of src/core/websocket/ws-gateway.ts: hello /
+# subscribe / unsubscribe / ping are answered locally, and an event goes to a
+# client when it subscribed to the event's category or has no subscriptions.
+
+def event_category(event_type):
+    if event_type.startswith('bootstrap.'):
+        return 'bootstrap'
+    if event_type.startswith('resolver.'):
+        return 'resolver'
+    if event_type.startswith('attribution.'):
+        return 'attribution'
+    if event_type.startswith('alert.'):
+        return 'alerts'
+    if event_type.startswith('signal.'):
+        return 'signals'
+    if event_type.startswith('job.'):
+        return 'jobs'
+    return 'resolver'
+
+class HubClient:
+    _ids = itertools.count(1)
+    
+    def __init__(self, websocket):
+        self.id = f"ws_hub_{next(HubClient._ids)}"
+        self.websocket = websocket
+        self.subscriptions = set()
+        self.queue = SendQueue()
+    
+    def send(self, message):
+        self.queue.put(message if isinstance(message, str) else json.dumps(message))
+
+class WsHub:
+    def __init__(self):
+        self.clients = {}
+        self.connected = False
+        self.upstream = None
+        self.wake = asyncio.Event()  # set to skip the reconnect backoff
+        self.stats = {'upstreamMessages': 0, 'deliveries': 0, 'reconnects': 0}
+    
+    def broadcast(self, text):
+        """Deliver one upstream frame to every matching client, reusing the encoded text."""
+        try:
+            message = json.loads(text)
+            event_type = message.get('type', '')
+        except (ValueError, AttributeError):
+            return
+        if event_type in ('connected', 'pong'):
+            return
+        self.stats['upstreamMessages'] += 1
+        ws_snapshots.record(text, message)
+        category = event_category(event_type)
+        for client in self.clients.values():
+            # Same rule as the TS gateway: job events only go to explicit subscribers
+            if category in client.subscriptions or (not client.subscriptions and category != 'jobs'):
+                client.queue.put(text)
+                self.stats['deliveries'] += 1
+    
+    def handle(self, client, data):
+        try:
+            message = json.loads(data)
+        except ValueError:
+            return
+        if not isinstance(message, dict):
+            return
+        kind = message.get('type')
+        if kind == 'hello' and isinstance(message.get('subscriptions'), list):
+            client.subscriptions = set(message['subscriptions'])
+            ws_snapshots.replay(client.queue, client.subscriptions)
+        elif kind == 'subscribe' and message.get('category'):
+            client.subscriptions.add(message['category'])
+            ws_snapshots.replay(client.queue, {message['category']})
+        elif kind == 'unsubscribe' and message.get('category'):
+            client.subscriptions.discard(message['category'])
+        elif kind == 'ping':
+            client.send({'type': 'pong', 'timestamp': int(time.time() * 1000)})
+    
+    async def detach(self):
+        """Drop the upstream socket so run_ws_hub() reconnects to the current primary."""
+        if self.upstream is not None:
+            await self.upstream.close(code=1012)
+    
+    def status(self):
+        return {'enabled': PROXY_WS_HUB, 'upstreamConnected': self.connected, 'clients': len(self.clients), **self.stats}
+
+ws_hub = WsHub()
+
+async def run_ws_hub():
+    """Keep the single upstream connection open, reconnecting with backoff."""
+    await backend_ready.wait()
+    delay = READY_POLL_INITIAL
+    while True:
+        worker = primary_worker()
+        try:
+            async with worker.ws_connect(max_size=None) as ts_ws:
+                ws_hub.upstream = ts_ws
+                ws_hub.connected = True
+                delay = READY_POLL_INITIAL
+                # No subscriptions = every category; filtering happens per client here
+                await ts_ws.send(json.dumps({'type': 'hello', 'subscriptions': []}))
+                async for msg in ts_ws:
+                    ws_hub.broadcast(msg if isinstance(msg, str) else msg.decode())
+        except (OSError, websockets.WebSocketException):
+            pass
+        finally:
+            ws_hub.upstream = None
+            ws_hub.connected = False
+        ws_hub.stats['reconnects'] += 1
+        try:
+            await asyncio.wait_for(ws_hub.wake.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+        ws_hub.wake.clear()
+        delay = min(delay * 2, READY_POLL_MAX * 5)
+
+async def ws_hub_client(websocket: WebSocket):
+    client = HubClient(websocket)
+    ws_hub.clients[client.id] = client
+    client.send({'type': 'connected', 'clientId': client.id, 'timestamp': int(time.time() * 1000)})
+    writer = asyncio.create_task(write_queue(websocket, client.queue))
+    try:
+        while True:
+            data = await websocket.receive_text()
+            metrics.ws_messages.inc('in')
+            ws_hub.handle(client, data)
+    except:
+        pass
+    finally:
+        ws_hub.clients.pop(client.id, None)
+        writer.cancel()
         try:
             await websocket.close()
         except:
             pass
+
+if __name__ == '__main__':
+    # python server.py build: bundle the TS backend ahead of time for TS_LAUNCH=auto
+    if sys.argv[1:] == ['build']:
+        sys.exit(0 if refresh_bundle(build=True) else 1)
+    print("usage: python server.py build")
+    sys.exit(2)
@@ -35,6 +35,19 @@ export function buildApp(): FastifyInstance {
     app.log.info('WebSocket plugin registered');
   }
 
+  // Deadline set by the proxy (epoch ms, X-Request-Deadline): a request that
+  // sat queued past it has no caller waiting any more, so skip the work. The
+  // X-Deadline-Exceeded header keeps the proxy from counting it as a failure.
+  app.addHook('onRequest', async (request, reply) => {
+    const deadline = Number(request.headers['x-request-deadline']);
+    if (deadline && Date.now() > deadline) {
+      return reply.status(503).header('x-deadline-exceeded', '1').send({
+        ok: false,
+        error: 'DEADLINE_EXCEEDED',
+      });
+    }
+  });
+
   // Global error handler
   app.setErrorHandler((err, _req, reply) => {
     app.log.error(err);
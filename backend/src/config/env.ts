@@ -38,6 +38,14 @@ const EnvSchema = z.object({
   
   // Legacy Python compatibility
   LEGACY_PYTHON_ENABLED: z.coerce.boolean().default(false),
+
+  // Proxy worker pool: only the primary runs scheduler/indexer/background workers.
+  // A standby (the next primary during a blue/green restart) serves like a replica
+  // until the proxy promotes it with PROXY_CONTROL_TOKEN.
+  WORKER_ROLE: z.enum(['primary', 'replica', 'standby']).default('primary'),
+  PROXY_CONTROL_TOKEN: z.string().optional(),
+  // Unix socket to listen on instead of PORT (set by the proxy); TCP if it cannot be bound
+  SOCKET_PATH: z.string().optional(),
 });
 
 export type Env = z.infer<typeof EnvSchema>;
@@ -62,6 +70,9 @@ export const env: Env = EnvSchema.parse({
   CONFIDENCE_FLOOR: process.env.CONFIDENCE_FLOOR,
   CONFIDENCE_SMOOTHING_FACTOR: process.env.CONFIDENCE_SMOOTHING_FACTOR,
   LEGACY_PYTHON_ENABLED: process.env.LEGACY_PYTHON_ENABLED,
+  WORKER_ROLE: process.env.WORKER_ROLE,
+  PROXY_CONTROL_TOKEN: process.env.PROXY_CONTROL_TOKEN || undefined,
+  SOCKET_PATH: process.env.SOCKET_PATH || undefined,
 });
 
 /**
@@ -17,7 +17,8 @@ export type EventType =
   | 'attribution.confirmed'
   | 'attribution.suspected'
   | 'alert.new'
-  | 'signal.new';
+  | 'signal.new'
+  | 'job.completed';
 
 // Event payloads
 export interface BootstrapProgressEvent {
@@ -68,6 +69,12 @@ export interface SignalNewEvent {
   action: string;
 }
 
+export interface JobCompletedEvent {
+  type: 'job.completed';
+  job: string;
+  durationMs: number;
+}
+
 export type SystemEvent = 
   | BootstrapProgressEvent
   | BootstrapDoneEvent
@@ -75,7 +82,8 @@ export type SystemEvent =
   | ResolverUpdatedEvent
   | AttributionConfirmedEvent
   | AlertNewEvent
-  | SignalNewEvent;
+  | SignalNewEvent
+  | JobCompletedEvent;
 
 // Single global event bus
 class EventBus extends EventEmitter {
@@ -13,7 +13,7 @@ import type { WebSocket } from 'ws';
 import { eventBus, SystemEvent } from './event-bus.js';
 
 // Subscription categories
-type SubscriptionCategory = 'bootstrap' | 'resolver' | 'attribution' | 'alerts' | 'signals';
+type SubscriptionCategory = 'bootstrap' | 'resolver' | 'attribution' | 'alerts' | 'signals' | 'jobs';
 
 // Client connection state
 interface WSClient {
@@ -206,8 +206,8 @@ function broadcastEvent(event: SystemEvent): void {
   const category = getEventCategory(event.type);
   
   for (const client of clients.values()) {
-    // Check if client is subscribed to this category
-    if (client.subscriptions.has(category) || client.subscriptions.size === 0) {
+    // Check if client is subscribed to this category (job events are opt-in only)
+    if (client.subscriptions.has(category) || (client.subscriptions.size === 0 && category !== 'jobs')) {
       sendToClient(client, event);
     }
   }
@@ -222,6 +222,7 @@ function getEventCategory(eventType: string): SubscriptionCategory {
   if (eventType.startsWith('attribution.')) return 'attribution';
   if (eventType.startsWith('alert.')) return 'alerts';
   if (eventType.startsWith('signal.')) return 'signals';
+  if (eventType.startsWith('job.')) return 'jobs';
   return 'resolver'; // default
 }
 
@@ -293,6 +294,7 @@ export function getConnectionStats(): { total: number; subscriptions: Record<str
     attribution: 0,
     alerts: 0,
     signals: 0,
+    jobs: 0,
   };
   
   for (const client of clients.values()) {
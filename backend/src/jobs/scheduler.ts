@@ -3,6 +3,7 @@
  * Runs periodic tasks (indexer, score recalculations, bundle detection, etc.)
  */
 import { env } from '../config/env.js';
+import { eventBus } from '../core/websocket/event-bus.js';
 import { EthereumRpc, syncERC20Transfers, getSyncStatus } from '../onchain/ethereum/index.js';
 import { buildTransfersFromERC20, getBuildStatus } from './build_transfers.job.js';
 import { buildRelations, getBuildRelationsStatus } from './build_relations.job.js';
@@ -113,9 +114,12 @@ class Scheduler {
     }
 
     job.running = true;
+    const startedAt = Date.now();
     try {
       await job.handler();
       job.lastRun = new Date();
+      // Lets the proxy purge cached responses built from this job's data
+      eventBus.emitEvent({ type: 'job.completed', job: job.name, durationMs: Date.now() - startedAt });
     } catch (err) {
       console.error(`[Scheduler] Job ${job.name} failed:`, err);
     } finally {
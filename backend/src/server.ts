@@ -1,4 +1,6 @@
 import 'dotenv/config';
+import { rmSync } from 'node:fs';
+import type { FastifyInstance } from 'fastify';
 import { buildApp } from './app.js';
 import { connectMongo, disconnectMongo } from './db/mongoose.js';
 import { env } from './config/env.js';
@@ -8,6 +10,21 @@ import { startHealthMonitor, stopHealthMonitor } from './core/system/health.moni
 import * as bootstrapWorker from './core/bootstrap/bootstrap.worker.js';
 import { startTelegramPolling, stopTelegramPolling } from './telegram-polling.worker.js';
 
+/**
+ * Listen on a Unix socket (removing a stale one first). Returns false when it
+ * cannot be bound so the caller can fall back to TCP.
+ */
+async function listenOnSocket(app: FastifyInstance, path: string): Promise<boolean> {
+  try {
+    rmSync(path, { force: true });
+    await app.listen({ path });
+    return true;
+  } catch (err) {
+    console.warn(`[Server] Cannot listen on unix socket ${path}, falling back to TCP:`, err);
+    return false;
+  }
+}
+
 async function main(): Promise<void> {
   console.log('[Server] Starting BlockView Backend...');
   
@@ -21,40 +38,68 @@ async function main(): Promise<void> {
   // B6: Run startup checks (fail-fast)
   await runStartupChecks(app);
 
-  // Register scheduled jobs (including ERC-20 indexer)
-  registerDefaultJobs();
+  // Replica workers (proxy pool) only serve HTTP; jobs and workers run on the primary
+  let isPrimary = env.WORKER_ROLE === 'primary';
+
+  const startPrimaryJobs = async () => {
+    // Register scheduled jobs (including ERC-20 indexer)
+    registerDefaultJobs();
 
-  // Start scheduler jobs
-  scheduler.startAll();
+    // Start scheduler jobs
+    scheduler.startAll();
 
-  // Start bootstrap worker
-  const workerStarted = await bootstrapWorker.start();
-  console.log(`[Server] Bootstrap worker: ${workerStarted ? 'started' : 'skipped (lock held)'}`);
+    // Start bootstrap worker
+    const workerStarted = await bootstrapWorker.start();
+    console.log(`[Server] Bootstrap worker: ${workerStarted ? 'started' : 'skipped (lock held)'}`);
 
-  // B5: Start health monitor
-  startHealthMonitor();
+    // B5: Start health monitor
+    startHealthMonitor();
 
-  // TEMPORARY FIX: Start Telegram polling (until ingress routing is fixed)
-  console.log('[Server] Starting Telegram polling worker (TEMPORARY FIX)...');
-  startTelegramPolling().catch(err => {
-    console.error('[Server] Telegram polling error:', err);
-  });
+    // TEMPORARY FIX: Start Telegram polling (until ingress routing is fixed)
+    console.log('[Server] Starting Telegram polling worker (TEMPORARY FIX)...');
+    startTelegramPolling().catch(err => {
+      console.error('[Server] Telegram polling error:', err);
+    });
+  };
+
+  if (isPrimary) {
+    await startPrimaryJobs();
+  } else if (env.WORKER_ROLE === 'standby') {
+    // Next primary of a blue/green restart: the proxy promotes it once the old
+    // primary has stopped, so scheduler jobs and Telegram polling never run twice
+    console.log('[Server] Standby worker: jobs start when the proxy promotes it');
+    app.post('/internal/promote', async (request, reply) => {
+      if (!env.PROXY_CONTROL_TOKEN || request.headers['x-proxy-control'] !== env.PROXY_CONTROL_TOKEN) {
+        return reply.status(403).send({ ok: false, error: 'FORBIDDEN' });
+      }
+      if (!isPrimary) {
+        isPrimary = true;
+        console.log('[Server] Promoted to primary: starting jobs');
+        await startPrimaryJobs();
+      }
+      return { ok: true };
+    });
+  } else {
+    console.log('[Server] Replica worker: scheduler, bootstrap worker and polling disabled');
+  }
 
   // Graceful shutdown
   const shutdown = async (signal: string) => {
     console.log(`[Server] Received ${signal}, shutting down...`);
 
-    // Stop Telegram polling
-    stopTelegramPolling();
-    
-    // Stop monitoring first
-    stopHealthMonitor();
-    
-    // Stop worker
-    await bootstrapWorker.stop();
-    
-    // Stop scheduler
-    scheduler.stopAll();
+    if (isPrimary) {
+      // Stop Telegram polling
+      stopTelegramPolling();
+      
+      // Stop monitoring first
+      stopHealthMonitor();
+      
+      // Stop worker
+      await bootstrapWorker.stop();
+      
+      // Stop scheduler
+      scheduler.stopAll();
+    }
     
     // Close app and DB
     await app.close();
@@ -69,9 +114,14 @@ async function main(): Promise<void> {
 
   // Start server
   try {
-    await app.listen({ port: env.PORT, host: '0.0.0.0' });
-    console.log(`[Server] ✓ Backend started on port ${env.PORT}`);
-    console.log(`[Server] Environment: ${env.NODE_ENV}`);
+    let address = `port ${env.PORT}`;
+    if (env.SOCKET_PATH && (await listenOnSocket(app, env.SOCKET_PATH))) {
+      address = `unix socket ${env.SOCKET_PATH}`;
+    } else {
+      await app.listen({ port: env.PORT, host: '0.0.0.0' });
+    }
+    console.log(`[Server] ✓ Backend started on ${address}`);
+    console.log(`[Server] Environment: ${env.NODE_ENV} (${env.WORKER_ROLE})`);
     console.log(`[Server] WebSocket: ${env.WS_ENABLED ? 'enabled' : 'disabled'}`);
     console.log(`[Server] Indexer: ${env.INDEXER_ENABLED && env.INFURA_RPC_URL ? 'enabled' : 'disabled'}`);
   } catch (err) {
@@ -0,0 +1,213 @@
+"""
+BlockView Backend - Offline Stand-in
+
+A fake of the TypeScript backend for measuring the proxy in isolation.
+server.py launches it instead of tsx when TS_BACKEND=standin; it can also be
+run directly:
+
+    python standin_backend.py --port 8002
+    python standin_backend.py --uds /tmp/blockview-ts-8002.sock
+    python standin_backend.py record --base-url https://<deployment> --out recordings.json
+
+Serves /api/health, /api/market/* and /api/wallets/* from a recordings file
+(STANDIN_RECORDINGS) or synthetic JSON padded to STANDIN_PAYLOAD_BYTES, after
+STANDIN_LATENCY_MS (+/- STANDIN_JITTER_MS). `_bytes` / `_latency_ms` query
+parameters override both per request. /ws speaks the ws-gateway protocol and
+broadcasts an event every STANDIN_WS_INTERVAL_MS, each naming one of
+STANDIN_WS_ENTITIES entities per category so the same ids recur.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import time
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+
+PAYLOAD_BYTES = int(os.environ.get('STANDIN_PAYLOAD_BYTES', '2048'))
+LATENCY_MS = float(os.environ.get('STANDIN_LATENCY_MS', '0'))
+JITTER_MS = float(os.environ.get('STANDIN_JITTER_MS', '0'))
+WS_INTERVAL_MS = float(os.environ.get('STANDIN_WS_INTERVAL_MS', '1000'))
+WS_PAYLOAD_BYTES = int(os.environ.get('STANDIN_WS_PAYLOAD_BYTES', '256'))
+WS_ENTITIES = int(os.environ.get('STANDIN_WS_ENTITIES', '4'))
+RECORDINGS_PATH = os.environ.get('STANDIN_RECORDINGS', '')
+
+# Paths recorded by `record`, relative to the API root
+RECORD_PATHS = [
+    '/api/market/top-active-tokens?limit=5',
+    '/api/market/emerging-signals?limit=5',
+    '/api/market/new-actors?limit=5',
+    '/api/market/token-signals/0xdac17f958d2ee523a2206206994597c13d831ec7',
+    '/api/market/token-drivers/0xdac17f958d2ee523a2206206994597c13d831ec7',
+    '/api/market/token-activity/0xdac17f958d2ee523a2206206994597c13d831ec7',
+    '/api/market/token-clusters/0xdac17f958d2ee523a2206206994597c13d831ec7',
+    '/api/market/token-smart-money/0xdac17f958d2ee523a2206206994597c13d831ec7',
+    '/api/wallets/0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045/activity-snapshot?window=24h',
+]
+
+EVENT_TYPES = ['signal.new', 'alert.new', 'bootstrap.progress', 'resolver.updated', 'attribution.confirmed']
+
+# Entity id field of each event type, as in src/core/websocket/event-bus.ts
+EVENT_ID_FIELDS = {
+    'signal.new': 'signalId',
+    'alert.new': 'alertId',
+    'bootstrap.progress': 'dedupKey',
+    'resolver.updated': 'input',
+    'attribution.confirmed': 'subjectId',
+}
+
+
+def route_key(path):
+    """Collapse address/id segments so one recording serves every address."""
+    return re.sub(r'/0x[0-9a-fA-F]+', '/:addr', path)
+
+
+def load_recordings(path):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {route_key(k.split('?')[0]): v for k, v in json.load(f).items()}
+
+
+recordings = load_recordings(RECORDINGS_PATH)
+synthetic_bodies = {}
+
+
+def synthetic_body(path, size):
+    """JSON shaped like the real envelope, padded to roughly `size` bytes (memoised)."""
+    key = (route_key(path), size)
+    body = synthetic_bodies.get(key)
+    if body is None:
+        items = []
+        envelope = {'ok': True, 'data': {'path': key[0], 'generatedAt': int(time.time() * 1000), 'items': items}}
+        # Track the encoded size item by item (each one after the first adds its ', '
+        # separator) instead of re-encoding the envelope, so large bodies stay linear
+        length = len(json.dumps(envelope))
+        i = 0
+        while length < size:
+            item = {'id': i, 'address': f"0x{i:040x}", 'score': round(random.random(), 4), 'label': 'standin'}
+            items.append(item)
+            length += len(json.dumps(item)) + (2 if i else 0)
+            i += 1
+        body = synthetic_bodies[key] = json.dumps(envelope).encode()
+    return body
+
+
+async def simulate_latency(request):
+    latency = float(request.query_params.get('_latency_ms', LATENCY_MS))
+    if JITTER_MS:
+        latency = max(0.0, latency + random.uniform(-JITTER_MS, JITTER_MS))
+    if latency:
+        await asyncio.sleep(latency / 1000)
+
+
+async def health(request):
+    return JSONResponse({'ok': True, 'ts': int(time.time() * 1000), 'uptime': time.monotonic(), 'standin': True})
+
+
+async def api(request):
+    await simulate_latency(request)
+    path = request.url.path
+    recorded = recordings.get(route_key(path))
+    if recorded is not None:
+        return JSONResponse(recorded.get('body'), status_code=recorded.get('status', 200))
+    if request.method != 'GET':
+        await request.body()
+        return JSONResponse({'ok': True, 'data': {'path': path}})
+    size = int(request.query_params.get('_bytes', PAYLOAD_BYTES))
+    return Response(synthetic_body(path, size), media_type='application/json')
+
+
+client_ids = itertools.count(1)
+
+
+async def ws(websocket):
+    """Minimal ws-gateway: hello/subscribe/unsubscribe/ping plus periodic events."""
+    await websocket.accept()
+    subscriptions = set()
+    await websocket.send_text(json.dumps({'type': 'connected', 'clientId': f"ws_standin_{next(client_ids)}", 'timestamp': int(time.time() * 1000)}))
+
+    async def pump():
+        padding = 'x' * WS_PAYLOAD_BYTES
+        for seq in itertools.count(1):
+            await asyncio.sleep(WS_INTERVAL_MS / 1000)
+            event_type = EVENT_TYPES[seq % len(EVENT_TYPES)]
+            category = {'signal': 'signals', 'alert': 'alerts'}.get(event_type.split('.')[0], event_type.split('.')[0])
+            if subscriptions and category not in subscriptions:
+                continue
+            entity = f"{category}-{seq // len(EVENT_TYPES) % WS_ENTITIES}"
+            await websocket.send_text(json.dumps({'type': event_type, EVENT_ID_FIELDS[event_type]: entity, 'seq': seq, 'padding': padding}))
+
+    sender = asyncio.create_task(pump())
+    try:
+        while True:
+            message = json.loads(await websocket.receive_text())
+            kind = message.get('type')
+            if kind == 'hello' and isinstance(message.get('subscriptions'), list):
+                subscriptions = set(message['subscriptions'])
+            elif kind == 'subscribe' and message.get('category'):
+                subscriptions.add(message['category'])
+            elif kind == 'unsubscribe':
+                subscriptions.discard(message.get('category'))
+            elif kind == 'ping':
+                await websocket.send_text(json.dumps({'type': 'pong', 'timestamp': int(time.time() * 1000)}))
+    except (WebSocketDisconnect, ValueError, RuntimeError):
+        pass
+    finally:
+        sender.cancel()
+
+
+app = Starlette(routes=[
+    Route('/api/health', health),
+    Route('/api/{path:path}', api, methods=['GET', 'POST', 'PUT', 'DELETE', 'PATCH']),
+    WebSocketRoute('/ws', ws),
+])
+
+
+def record(base_url, out):
+    """Capture real responses for RECORD_PATHS into a recordings file."""
+    import httpx
+
+    captured = {}
+    with httpx.Client(base_url=base_url.rstrip('/'), timeout=60.0) as client:
+        for path in RECORD_PATHS:
+            response = client.get(path)
+            captured[path] = {'status': response.status_code, 'body': response.json()}
+            print(f"{response.status_code} {path} ({len(response.content)} bytes)")
+    with open(out, 'w') as f:
+        json.dump(captured, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    sub = parser.add_subparsers(dest='command')
+    rec = sub.add_parser('record')
+    rec.add_argument('--base-url', required=True)
+    rec.add_argument('--out', default='recordings.json')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', '8002')))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--uds', default=os.environ.get('SOCKET_PATH'), help='listen on a unix socket instead of the port')
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        record(args.base_url, args.out)
+        return
+    import uvicorn
+    if args.uds:
+        if os.path.exists(args.uds):
+            os.unlink(args.uds)
+        uvicorn.run(app, uds=args.uds, log_level='warning', access_log=False)
+        return
+    uvicorn.run(app, host=args.host, port=args.port, log_level='warning', access_log=False)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+Load / latency harness shared by the performance tests
+
+Drives one endpoint at a fixed concurrency with an async httpx client and
+summarises latency percentiles and throughput. Results are compared with a
+stored baseline (test_reports/perf_baseline.json) so regressions fail CI.
+"""
+import asyncio
+import json
+import time
+from pathlib import Path
+
+import httpx
+
+REPORTS_DIR = Path(__file__).parent.parent / 'test_reports'
+BASELINE_PATH = REPORTS_DIR / 'perf_baseline.json'
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies, errors, elapsed):
+    ordered = sorted(latencies)
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'p50_ms': round(percentile(ordered, 50) * 1000, 2),
+        'p95_ms': round(percentile(ordered, 95) * 1000, 2),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2) if ordered else 0.0,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+async def drive(client, method, url, total, concurrency, headers=None, json_body=None):
+    """
+    Send `total` requests with `concurrency` in flight; returns a summary.
+
+    A request counts as an error on transport failure or a non-2xx status.
+    """
+    latencies = []
+    errors = 0
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, headers=headers, json=json_body)
+                await response.aread()
+                ok = 200 <= response.status_code < 300
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def run_load(base_url, path, total, concurrency, warmup=5, method='GET', headers=None, json_body=None, timeout=60.0, uds=None):
+    """Synchronous wrapper: warm up, then drive one endpoint (over a unix socket when `uds` is set)."""
+    async def main():
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        transport = httpx.AsyncHTTPTransport(uds=uds, limits=limits) if uds else None
+        async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits, transport=transport) as client:
+            if warmup:
+                await drive(client, method, path, warmup, min(warmup, concurrency), headers, json_body)
+            return await drive(client, method, path, total, concurrency, headers, json_body)
+    return asyncio.run(main())
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f).get('endpoints', {})
+
+
+def save_results(results, path, meta=None):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'meta': meta or {}, 'endpoints': results}, f, indent=2, sort_keys=True)
+
+
+def regressions(result, baseline, margin, floor_ms=5.0):
+    """
+    Compare one endpoint's summary with its baseline.
+
+    Latency percentiles may grow by `margin` (fraction) plus `floor_ms` of
+    absolute slack, so tiny baselines do not fail on scheduler noise;
+    throughput may drop by `margin`. Returns human-readable failures.
+    """
+    failures = []
+    for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+        if key in baseline:
+            limit = baseline[key] * (1 + margin) + floor_ms
+            if result[key] > limit:
+                failures.append(f"{key} {result[key]} > {round(limit, 2)} (baseline {baseline[key]})")
+    if baseline.get('throughput_rps'):
+        limit = baseline['throughput_rps'] * (1 - margin)
+        if result['throughput_rps'] < limit:
+            failures.append(f"throughput_rps {result['throughput_rps']} < {round(limit, 1)} (baseline {baseline['throughput_rps']})")
+    return failures
@@ -0,0 +1,76 @@
+"""
+Load & Latency Regression Tests
+
+Drives the endpoints covered by the functional suites at a configurable
+concurrency and checks p50/p95/p99 latency and throughput against the
+baseline stored in test_reports/perf_baseline.json.
+
+Opt-in (hammers the target): LOAD_TEST=1
+- LOAD_TEST_REQUESTS       requests per endpoint (default 200)
+- LOAD_TEST_CONCURRENCY    requests in flight (default 20)
+- LOAD_TEST_MARGIN         allowed regression as a fraction (default 0.25)
+- PERF_UPDATE_BASELINE=1   write this run as the new baseline
+
+Every run is written to test_reports/perf/latest.json.
+"""
+import os
+
+import pytest
+
+from tests.load_harness import BASELINE_PATH, REPORTS_DIR, load_baseline, regressions, run_load, save_results
+from tests.test_p0_p2_wallet_market import TEST_WALLET
+from tests.test_token_signals_drivers import BASE_URL, USDT_ADDRESS
+
+REQUESTS = int(os.environ.get('LOAD_TEST_REQUESTS', '200'))
+CONCURRENCY = int(os.environ.get('LOAD_TEST_CONCURRENCY', '20'))
+MARGIN = float(os.environ.get('LOAD_TEST_MARGIN', '0.25'))
+UPDATE_BASELINE = os.environ.get('PERF_UPDATE_BASELINE') == '1'
+
+pytestmark = pytest.mark.skipif(
+    os.environ.get('LOAD_TEST') != '1' or not BASE_URL,
+    reason='load tests are opt-in: set LOAD_TEST=1 and REACT_APP_BACKEND_URL',
+)
+
+ENDPOINTS = {
+    'health': '/api/health',
+    'token_signals': f'/api/market/token-signals/{USDT_ADDRESS}',
+    'token_drivers': f'/api/market/token-drivers/{USDT_ADDRESS}',
+    'token_activity': f'/api/market/token-activity/{USDT_ADDRESS}',
+    'token_clusters': f'/api/market/token-clusters/{USDT_ADDRESS}',
+    'token_smart_money': f'/api/market/token-smart-money/{USDT_ADDRESS}',
+    'top_active_tokens': '/api/market/top-active-tokens?limit=5',
+    'emerging_signals': '/api/market/emerging-signals?limit=5',
+    'new_actors': '/api/market/new-actors?limit=5',
+    'wallet_activity_snapshot': f'/api/wallets/{TEST_WALLET}/activity-snapshot?window=24h',
+}
+
+RESULTS = {}
+
+
+@pytest.fixture(scope='module', autouse=True)
+def report():
+    """Write the run (and optionally the new baseline) once every endpoint ran."""
+    yield
+    meta = {'base_url': BASE_URL, 'requests': REQUESTS, 'concurrency': CONCURRENCY}
+    save_results(RESULTS, REPORTS_DIR / 'perf' / 'latest.json', meta)
+    if UPDATE_BASELINE and RESULTS:
+        save_results({**load_baseline(), **RESULTS}, BASELINE_PATH, meta)
+
+
+class TestEndpointLatency:
+    """Latency and throughput per endpoint vs. the stored baseline"""
+
+    @pytest.mark.parametrize('name', list(ENDPOINTS))
+    def test_no_latency_regression(self, name):
+        """Endpoint stays error-free and within the baseline margin"""
+        result = run_load(BASE_URL, ENDPOINTS[name], REQUESTS, CONCURRENCY)
+        RESULTS[name] = result
+        print(f"\n{name}: {result}")
+
+        assert result['errors'] == 0, f"{result['errors']} failed requests"
+
+        baseline = load_baseline().get(name)
+        if baseline is None or UPDATE_BASELINE:
+            return
+        failures = regressions(result, baseline, MARGIN)
+        assert not failures, f"{name} regressed: " + '; '.join(failures)
@@ -0,0 +1,78 @@
+"""
+Proxy Batch API Unit Tests (offline)
+
+Exercises backend/server.py's /api/batch helpers in-process, with no
+backend or network.
+Tests:
+- batch_items(): accepted body shapes and rejected entries
+- batch_body(): sub-response bodies decoded from any content-encoding
+"""
+import gzip
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+import server  # noqa: E402
+
+
+class TestBatchItems:
+    """Validation of the batch request body"""
+
+    def test_accepts_paths_and_objects(self):
+        """Bare path strings and {id, path} objects; ids default to the index"""
+        items = server.batch_items({'requests': [
+            '/api/market/top-active-tokens?limit=5',
+            {'id': 'signals', 'path': '/api/market/emerging-signals'},
+        ]})
+        assert items == [
+            ('0', '/api/market/top-active-tokens', 'limit=5'),
+            ('signals', '/api/market/emerging-signals', ''),
+        ]
+
+    def test_accepts_a_bare_list(self):
+        """The list itself may be the body"""
+        assert server.batch_items(['/api/health']) == [('0', '/api/health', '')]
+
+    @pytest.mark.parametrize('payload', [{}, {'requests': []}, {'requests': '/api/health'}, 'nope', None])
+    def test_rejects_missing_or_empty_list(self, payload):
+        """Anything but a non-empty list is a client error"""
+        with pytest.raises(ValueError, match='non-empty'):
+            server.batch_items(payload)
+
+    def test_rejects_too_many_requests(self, monkeypatch):
+        """More than BATCH_MAX_REQUESTS entries is refused"""
+        monkeypatch.setattr(server, 'BATCH_MAX_REQUESTS', 2)
+        with pytest.raises(ValueError, match='At most 2'):
+            server.batch_items(['/api/health'] * 3)
+
+    @pytest.mark.parametrize('entry', [
+        'https://example.com/api/health',
+        '/health',
+        '/api/batch',
+        '/api/batch/?stream=1',
+        {'id': 'x'},
+        {'path': 42},
+        7,
+    ])
+    def test_rejects_bad_entries(self, entry):
+        """Only /api/ paths, and never the batch endpoint itself"""
+        with pytest.raises(ValueError, match=r'requests\[1\]'):
+            server.batch_items(['/api/health', entry])
+
+
+class TestBatchBody:
+    """Sub-responses are embedded as JSON whatever their encoding"""
+
+    def test_decodes_json(self):
+        """Identity and gzip bodies both come back parsed"""
+        plain = server.UpstreamReply(200, {}, b'{"ok": true}')
+        zipped = server.UpstreamReply(200, {'content-encoding': 'gzip'}, gzip.compress(b'{"ok": true}'))
+        assert server.batch_body(plain) == server.batch_body(zipped) == {'ok': True}
+
+    def test_falls_back_to_text_and_reports_bad_encodings(self):
+        """Non-JSON is returned as text; an undecodable body is an error object"""
+        assert server.batch_body(server.UpstreamReply(502, {}, b'Bad gateway')) == 'Bad gateway'
+        broken = server.UpstreamReply(200, {'content-encoding': 'gzip'}, b'not gzip')
+        assert server.batch_body(broken) == {'error': 'Undecodable gzip body'}
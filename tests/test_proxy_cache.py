@@ -0,0 +1,281 @@
+"""
+Proxy Response Cache Unit Tests (offline)
+
+Exercises backend/server.py's cache pieces in-process, with no backend,
+network or Mongo: fetch_upstream() is replaced by a counting fake.
+Tests:
+- ResponseCache: TTL / stale-while-revalidate, byte-bounded LRU, tag purges
+  and purge epochs for fills in flight
+- SingleFlight: shared calls, callers leaving, errors
+- ETags: content hashing, encoding-suffixed variants, If-None-Match / 304
+- Read-your-writes: a GET after a write never joins a pre-write flight
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+from fastapi import Request, Response
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+import server  # noqa: E402
+
+USER = 'user-1'
+
+
+@pytest.fixture
+def proxy(monkeypatch):
+    """Fresh cache and single-flight state, and a fake upstream that counts fetches"""
+    monkeypatch.setattr(server, 'response_cache', server.ResponseCache(1 << 20))
+    monkeypatch.setattr(server, 'single_flight', server.SingleFlight())
+    monkeypatch.setattr(server, 'PROXY_COALESCE_ENABLED', True)
+    fetches = []
+
+    async def fetch_upstream(method, target, headers):
+        version = len(fetches)
+        fetches.append(target)
+        await asyncio.sleep(0.05)
+        return server.UpstreamReply(200, {'content-type': 'application/json'}, f'{{"version": {version}}}'.encode())
+
+    monkeypatch.setattr(server, 'fetch_upstream', fetch_upstream)
+    return fetches
+
+
+def reply(body=b'{}', **headers):
+    return server.UpstreamReply(200, {'content-type': 'application/json', **headers}, body)
+
+
+def entry(ttl=60, swr=60, tags=(), body=b'{}'):
+    return server.CacheEntry(reply(body), ttl, swr, '/api/x', {}, tags)
+
+
+def request(method='GET', **headers):
+    scope = {
+        'type': 'http', 'method': method, 'path': '/api/x', 'query_string': b'',
+        'headers': [(name.replace('_', '-').encode(), value.encode()) for name, value in headers.items()],
+    }
+    return Request(scope)
+
+
+def respond(req, upstream, cached=None):
+    return asyncio.run(server.reply_response(req, upstream, cached=cached))
+
+
+def get(path):
+    rule = server.match_cache_rule(path)
+    return server.cached_fetch(path, '', path, rule, {'x-user-id': USER})
+
+
+class TestResponseCache:
+    """TTL / SWR classification, size bound and tag purges"""
+
+    def test_fresh_stale_then_gone(self):
+        """Fresh inside ttl, stale inside the swr window, dropped after both"""
+        cache = server.ResponseCache(1 << 20)
+        cached = entry(ttl=60, swr=30)
+        cache.put('k', cached)
+        assert cache.get('k') == (cached, 'fresh')
+        cached.stored -= 70
+        assert cache.get('k') == (cached, 'stale')
+        cached.stored -= 30
+        assert cache.get('k') == (None, None)
+        assert 'k' not in cache.entries and cache.size == 0
+        assert (cache.stats['hits'], cache.stats['stale'], cache.stats['misses']) == (1, 1, 1)
+
+    def test_evicts_least_recently_used_past_max_bytes(self):
+        """Total bytes stay bounded; a read keeps an entry from being the next to go"""
+        size = entry(body=b'x' * 100).size
+        cache = server.ResponseCache(size * 2)
+        cache.put('a', entry(body=b'x' * 100))
+        cache.put('b', entry(body=b'x' * 100))
+        cache.get('a')
+        cache.put('c', entry(body=b'x' * 100))
+        assert list(cache.entries) == ['a', 'c']
+        assert cache.size == size * 2 and cache.stats['evictions'] == 1
+        cache.put('huge', entry(body=b'x' * size * 3))
+        assert 'huge' not in cache.entries
+
+    def test_purge_drops_tagged_entries(self):
+        """Only entries carrying a purged tag go"""
+        cache = server.ResponseCache(1 << 20)
+        cache.put('market', entry(tags=('market',)))
+        cache.put('both', entry(tags=('market', 'signals')))
+        cache.put('wallets', entry(tags=('wallets',)))
+        assert cache.purge(('market',)) == 2
+        assert list(cache.entries) == ['wallets']
+        assert 'market' not in cache.tags and 'signals' not in cache.tags
+
+    def test_fill_from_before_a_purge_of_its_tag_is_dropped(self):
+        """A fill that read the epoch before a purge of one of its tags is not stored"""
+        cache = server.ResponseCache(1 << 20)
+        epoch = cache.epoch
+        cache.purge(('market',))
+        cache.put('stale', entry(tags=('market',)), epoch)
+        cache.put('other', entry(tags=('wallets',)), epoch)
+        cache.put('fresh', entry(tags=('market',)), cache.epoch)
+        assert sorted(cache.entries) == ['fresh', 'other']
+        assert cache.stats['dropped'] == 1
+
+    def test_forgotten_purges_raise_the_floor(self):
+        """Once a purge is too old to remember, fills older than it are dropped whatever their tags"""
+        cache = server.ResponseCache(1 << 20)
+        epoch = cache.epoch
+        cache.purge(('market',))
+        cache.purged['market'] = (cache.purged['market'][0], cache.purged['market'][1] - server.CACHE_PURGE_MEMORY - 1)
+        cache.purge(('signals',))
+        assert 'market' not in cache.purged and cache.purge_floor == 1
+        assert cache.purge_epoch(('wallets',)) == 1
+        assert cache.purge_epoch(('signals',)) == 2
+        cache.put('old', entry(tags=('wallets',)), epoch)
+        assert 'old' not in cache.entries
+
+
+class TestSingleFlight:
+    """One upstream call per key, shared by every concurrent caller"""
+
+    def test_leader_leaving_does_not_cancel_followers(self):
+        """A cancelled leader leaves the call running for its follower"""
+        flight = server.SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'reply'
+
+        async def scenario():
+            leader = asyncio.ensure_future(flight.do('k', fetch))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(flight.do('k', fetch))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await follower
+
+        assert asyncio.run(scenario()) == 'reply'
+        assert len(calls) == 1
+        assert flight.stats == {'leaders': 1, 'followers': 1, 'abandoned': 0}
+        assert not flight.calls and not flight.waiters
+
+    def test_call_is_cancelled_once_every_caller_left(self):
+        """When the last caller goes the upstream call is cancelled and counted"""
+        flight = server.SingleFlight()
+        finished = []
+
+        async def fetch():
+            await asyncio.sleep(1)
+            finished.append(1)
+
+        async def scenario():
+            callers = [asyncio.ensure_future(flight.do('k', fetch)) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            for caller in callers:
+                caller.cancel()
+            await asyncio.gather(*callers, return_exceptions=True)
+            await asyncio.sleep(0)
+
+        asyncio.run(scenario())
+        assert not finished
+        assert flight.stats['abandoned'] == 1
+        assert not flight.calls and not flight.waiters
+
+    def test_error_reaches_every_caller_and_clears_the_key(self):
+        """A failed call raises in each caller; the next call starts afresh"""
+        flight = server.SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise server.BackendUnavailable()
+
+        async def ok():
+            return 'reply'
+
+        async def scenario():
+            results = await asyncio.gather(flight.do('k', fail), flight.do('k', fail), return_exceptions=True)
+            return results, await flight.do('k', ok)
+
+        results, after = asyncio.run(scenario())
+        assert all(isinstance(result, server.BackendUnavailable) for result in results)
+        assert after == 'reply'
+        assert flight.stats['leaders'] == 2
+
+
+class TestETags:
+    """ETag on successful GETs, 304 for a matching If-None-Match"""
+
+    BODY = b'{"data": "' + b'x' * 4096 + b'"}'
+
+    def test_content_etag(self):
+        """Hash of the body unless upstream sent its own"""
+        first, second = reply(self.BODY), reply(self.BODY)
+        assert server.content_etag(first) == server.content_etag(second)
+        assert server.content_etag(first) != server.content_etag(reply(b'{}'))
+        assert server.content_etag(reply(self.BODY, etag='"up"')) == '"up"'
+
+    def test_variant_etags_match_their_representation(self):
+        """Encoding suffixes keep variants distinct but still match the identity tag"""
+        assert server.variant_etag('"abc"', 'br') == '"abc-br"'
+        assert server.etag_matches('"abc-gzip"', '"abc"')
+        assert server.etag_matches('W/"abc", "other"', '"abc-br"')
+        assert server.etag_matches('*', '"abc"')
+        assert not server.etag_matches('"abd"', '"abc"')
+        assert not server.etag_matches(None, '"abc"')
+
+    def test_matching_if_none_match_gets_304(self, monkeypatch):
+        """An empty 304 with the ETag but no body headers"""
+        monkeypatch.setattr(server, 'PROXY_ETAG', True)
+        upstream = reply(self.BODY)
+        first = respond(request(), upstream)
+        etag = first.headers['etag']
+        assert first.status_code == 200 and first.body == self.BODY
+        again = respond(request(if_none_match=etag), upstream)
+        assert again.status_code == 304 and again.body == b''
+        assert again.headers['etag'] == etag and 'content-type' not in again.headers
+        assert respond(request(if_none_match='"stale"'), upstream).status_code == 200
+        assert respond(request('POST', if_none_match=etag), upstream).status_code == 200
+
+    def test_compressed_variant_has_suffixed_etag(self, monkeypatch):
+        """A gzip response carries "<etag>-gzip", revalidates to 304 and is kept on the cache entry"""
+        monkeypatch.setattr(server, 'PROXY_ETAG', True)
+        monkeypatch.setattr(server, 'PROXY_COMPRESSION', True)
+        monkeypatch.setattr(server, 'response_cache', server.ResponseCache(1 << 20))
+        cached = entry(body=self.BODY)
+        server.response_cache.put('k', cached)
+        response = respond(request(accept_encoding='gzip'), cached.reply, cached=('k', cached))
+        etag = server.content_etag(cached.reply)
+        assert response.headers['content-encoding'] == 'gzip'
+        assert response.headers['etag'] == server.variant_etag(etag, 'gzip')
+        assert 'gzip' in cached.variants
+        revalidated = respond(request(accept_encoding='gzip', if_none_match=response.headers['etag']), cached.reply)
+        assert revalidated.status_code == 304
+
+
+class TestReadYourWrites:
+    """A write purges its tags; reads after it must not see pre-write data"""
+
+    def test_read_after_write_starts_its_own_flight(self, proxy):
+        """A GET issued after the write is a new leader, not a follower of the older GET"""
+        async def scenario():
+            before = asyncio.ensure_future(get('/api/watchlist'))
+            await asyncio.sleep(0.01)  # the pre-write fetch is in flight
+            server.write_through('POST', '/api/watchlist', USER, Response(status_code=201))
+            after = await get('/api/watchlist')
+            return await before, after
+
+        (before, _, _), (after, state, cached) = asyncio.run(scenario())
+        assert len(proxy) == 2
+        assert server.single_flight.stats['followers'] == 0
+        assert before.body == b'{"version": 0}'
+        assert after.body == b'{"version": 1}'
+        assert state == 'MISS' and cached is not None
+        # the pre-write fill was dropped; the post-write one is what gets served
+        assert server.response_cache.entries[cached[0]].reply.body == b'{"version": 1}'
+
+    def test_reads_without_a_write_still_coalesce(self, proxy):
+        """Concurrent GETs with no purge between them share one upstream fetch"""
+        async def scenario():
+            return await asyncio.gather(get('/api/watchlist'), get('/api/watchlist'))
+
+        first, second = asyncio.run(scenario())
+        assert len(proxy) == 1
+        assert server.single_flight.stats['followers'] == 1
+        assert first[0] is second[0]
@@ -0,0 +1,250 @@
+"""
+Proxy Load Protection Unit Tests (offline)
+
+Exercises backend/server.py's admission control in-process, with no
+backend or network.
+Tests:
+- AdaptiveLimiter: slots, FIFO wait queue, shedding, gradient limit updates
+- CircuitBreaker: closed -> open -> half-open -> closed / open again
+- admit() / Admission: shedding on an open circuit, deadline-skipped replies
+- RateLimiter: token buckets, idle and full-shard eviction, sweeping
+"""
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+import server  # noqa: E402
+
+
+@pytest.fixture
+def small_limit(monkeypatch):
+    """A limiter starting at 2 slots that may go down to 1"""
+    monkeypatch.setattr(server, 'LIMIT_INITIAL', 2)
+    monkeypatch.setattr(server, 'LIMIT_MIN', 1)
+    return server.AdaptiveLimiter()
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    """A breaker that trips at 50% errors over 4 requests"""
+    monkeypatch.setattr(server, 'BREAKER_MIN_REQUESTS', 4)
+    monkeypatch.setattr(server, 'BREAKER_ERROR_RATE', 0.5)
+    monkeypatch.setattr(server, 'BREAKER_COOLDOWN', 10)
+    return server.CircuitBreaker()
+
+
+class TestAdaptiveLimiter:
+    """Concurrency slots per route class"""
+
+    def test_queued_acquires_get_freed_slots_in_order(self, small_limit):
+        """Past the limit callers wait; each release hands a slot to the oldest waiter"""
+        limiter = small_limit
+        order = []
+
+        async def waiter(name):
+            assert await limiter.acquire()
+            order.append(name)
+
+        async def scenario():
+            assert await limiter.acquire() and await limiter.acquire()
+            waiters = [asyncio.ensure_future(waiter(name)) for name in ('first', 'second')]
+            await asyncio.sleep(0)
+            assert len(limiter.waiters) == 2 and not order
+            limiter.release()
+            await asyncio.sleep(0.01)
+            assert order == ['first']
+            limiter.release()
+            await asyncio.gather(*waiters)
+
+        asyncio.run(scenario())
+        assert order == ['first', 'second']
+        assert limiter.in_flight == 2
+        assert limiter.stats['queued'] == 2 and limiter.stats['shed'] == 0
+
+    def test_sheds_after_queue_timeout(self, small_limit, monkeypatch):
+        """A waiter that gets no slot within LIMIT_QUEUE_TIMEOUT is shed and leaves the queue"""
+        monkeypatch.setattr(server, 'LIMIT_QUEUE_TIMEOUT', 0.02)
+        limiter = small_limit
+
+        async def scenario():
+            await limiter.acquire()
+            await limiter.acquire()
+            return await limiter.acquire()
+
+        assert asyncio.run(scenario()) is False
+        assert not limiter.waiters
+        assert limiter.stats['shed'] == 1
+
+    def test_sheds_at_once_when_queue_is_full(self, small_limit, monkeypatch):
+        """With no queue room the call is shed without waiting"""
+        monkeypatch.setattr(server, 'LIMIT_QUEUE', 0)
+        limiter = small_limit
+
+        async def scenario():
+            await limiter.acquire()
+            await limiter.acquire()
+            return await limiter.acquire()
+
+        assert asyncio.run(scenario()) is False
+        assert limiter.stats['queued'] == 0
+
+    def test_slow_responses_lower_the_limit(self, monkeypatch):
+        """Latency well above the baseline pulls the limit down, never below LIMIT_MIN"""
+        monkeypatch.setattr(server, 'LIMIT_MIN', 10)
+        limiter = server.AdaptiveLimiter()
+        limiter.adjust(40, 0.01, False)
+        start = limiter.limit
+        for _ in range(200):
+            limiter.adjust(40, 1.0, False)
+        assert limiter.limit < start
+        assert limiter.limit == 10
+
+    def test_fast_responses_grow_the_limit_only_under_load(self):
+        """Latency at the baseline grows the limit while it is more than half used"""
+        limiter = server.AdaptiveLimiter()
+        start = limiter.limit
+        limiter.adjust(1, 0.01, False)
+        assert limiter.limit == start  # app-limited: nothing learned
+        limiter.adjust(int(start), 0.01, False)
+        assert limiter.limit > start
+
+    def test_drops_cut_the_limit_and_abandoned_calls_teach_nothing(self):
+        """Timeouts cut 10%; a release without an rtt leaves the limit alone"""
+        limiter = server.AdaptiveLimiter()
+        start = limiter.limit
+        limiter.adjust(10, None, False)
+        assert limiter.limit == start
+        limiter.adjust(10, None, True)
+        assert limiter.limit == pytest.approx(start * 0.9)
+        assert limiter.stats['drops'] == 1
+
+
+class TestCircuitBreaker:
+    """Per-route breaker state transitions"""
+
+    def test_trips_on_error_rate(self, breaker):
+        """Opens once enough requests fail; until then it stays closed"""
+        for ok in (True, True, False):
+            breaker.record(ok)
+        assert breaker.state == 'closed' and breaker.allow() is None
+        breaker.record(False)
+        assert breaker.state == 'open' and breaker.trips == 1
+        assert 0 < breaker.allow() <= server.BREAKER_COOLDOWN
+
+    def test_half_open_probe_success_closes(self, breaker):
+        """After the cooldown one probe goes through; its success closes the circuit"""
+        breaker.trip(time.monotonic() - server.BREAKER_COOLDOWN)
+        assert breaker.allow() is None
+        assert breaker.state == 'half-open'
+        assert breaker.allow() == 1.0  # only one probe at a time
+        breaker.record(True)
+        assert breaker.state == 'closed' and breaker.allow() is None
+
+    def test_half_open_probe_failure_reopens(self, breaker):
+        """A failed probe opens the circuit for another cooldown"""
+        breaker.trip(time.monotonic() - server.BREAKER_COOLDOWN)
+        assert breaker.allow() is None
+        breaker.record(False)
+        assert breaker.state == 'open' and breaker.trips == 2
+        assert breaker.allow() > 0
+
+    def test_cancelled_probe_frees_the_slot(self, breaker):
+        """An abandoned probe lets the next request probe instead"""
+        breaker.trip(time.monotonic() - server.BREAKER_COOLDOWN)
+        assert breaker.allow() is None
+        breaker.cancel_probe()
+        assert breaker.allow() is None
+
+
+class TestAdmission:
+    """admit() combines breaker and limiter; Admission settles both"""
+
+    def test_open_circuit_sheds(self, breaker, monkeypatch):
+        """A request on a route with an open circuit raises Overloaded"""
+        monkeypatch.setattr(server, 'PROXY_BREAKER_ENABLED', True)
+        monkeypatch.setattr(server, 'breakers', {'/api/x': breaker})
+        breaker.trip(time.monotonic())
+        with pytest.raises(server.Overloaded) as shed:
+            asyncio.run(server.admit('default', '/api/x'))
+        assert shed.value.reason == 'circuit_open'
+
+    def test_deadline_skipped_reply_feeds_neither(self, breaker, small_limit):
+        """A reply the backend skipped for its deadline frees the slot without counting as an error"""
+        admission = server.Admission(small_limit, breaker)
+        small_limit.in_flight = 1
+        admission.settle(503, {server.DEADLINE_EXCEEDED_HEADER: '1'})
+        assert small_limit.in_flight == 0 and small_limit.short_rtt is None
+        assert breaker.status()['windowRequests'] == 0
+        admission.settle(503)
+        assert breaker.status()['windowRequests'] == 0  # settled once only
+
+
+def rate_limiter(max_keys=2, shards=1):
+    """One token a second, bursts of 2"""
+    return server.RateLimiter({'default': (1.0, 2)}, shards, max_keys)
+
+
+def idle(limiter, user):
+    bucket = limiter.shards['default'][hash(user) % len(limiter.shards['default'])][user]
+    bucket[1] -= 10
+
+
+class TestRateLimiter:
+    """Per-user token buckets, bounded by shard"""
+
+    def test_burst_then_limited_then_refilled(self):
+        """A user gets the burst, then waits for the next token"""
+        limiter = rate_limiter()
+        assert limiter.take('u1', 'default') == 0 and limiter.take('u1', 'default') == 0
+        assert 0 < limiter.take('u1', 'default') <= 1
+        assert limiter.take('u2', 'default') == 0  # buckets are per user
+        idle(limiter, 'u1')
+        assert limiter.take('u1', 'default') == 0
+        assert limiter.stats['limited'] == 1
+
+    def test_full_shard_evicts_idle_buckets_first(self):
+        """Refilled buckets go before anyone is forgiven"""
+        limiter = rate_limiter()
+        limiter.take('idle', 'default')
+        limiter.take('busy', 'default')
+        idle(limiter, 'idle')
+        limiter.take('new', 'default')
+        assert set(limiter.shards['default'][0]) == {'busy', 'new'}
+        assert limiter.stats['evictedIdle'] == 1 and limiter.stats['evictedFull'] == 0
+
+    def test_full_shard_drops_oldest_when_none_idle(self):
+        """With no idle bucket the oldest-inserted one is dropped"""
+        limiter = rate_limiter()
+        for user in ('first', 'second', 'third'):
+            limiter.take(user, 'default')
+        assert list(limiter.shards['default'][0]) == ['second', 'third']
+        assert limiter.stats['evictedFull'] == 1
+
+    def test_sweep_visits_one_shard_per_tick(self):
+        """Each sweep evicts idle buckets from the next shard only"""
+        limiter = rate_limiter(max_keys=100, shards=2)
+        users = {}
+        for n in range(20):
+            users.setdefault(hash(f"u{n}") % 2, f"u{n}")
+        for user in users.values():
+            limiter.take(user, 'default')
+            idle(limiter, user)
+        limiter.sweep()
+        assert not limiter.shards['default'][0] and users[1] in limiter.shards['default'][1]
+        limiter.sweep()
+        assert not limiter.shards['default'][1]
+        assert limiter.stats['evictedIdle'] == 2
+
+    def test_shared_ids_and_anonymous_callers_are_not_limited(self, monkeypatch):
+        """No x-user-id, or a shared one, is never rate limited"""
+        monkeypatch.setattr(server, 'PROXY_RATE_LIMIT_ENABLED', True)
+        monkeypatch.setattr(server, 'RATE_LIMIT_SHARED_IDS', {'anonymous'})
+        monkeypatch.setattr(server, 'rate_limiter', rate_limiter())
+        for _ in range(5):
+            assert server.rate_limit_wait(None, 'GET', '/api/market/top-active-tokens') == 0
+            assert server.rate_limit_wait('anonymous', 'GET', '/api/market/top-active-tokens') == 0
+        assert not server.rate_limiter.shards['default'][0]
@@ -0,0 +1,191 @@
+"""
+Proxy Overhead Benchmark (offline)
+
+Starts backend/server.py with TS_BACKEND=standin, so the proxy fronts the
+stand-in backend instead of the TS server, and drives the same endpoints
+twice: directly against the stand-in and through the proxy. The difference
+in p50/p95/p99 is the latency the proxy adds; the proxy process's CPU time
+over the proxied run divided by the request count is the CPU it adds.
+Each run is repeated per proxy->backend transport (TCP loopback vs. unix
+socket, PROXY_UDS) so the two can be compared.
+
+No network, Mongo or TS build needed. Opt-in: PROXY_BENCH=1
+- PROXY_BENCH_REQUESTS      requests per endpoint (default 500)
+- PROXY_BENCH_CONCURRENCY   requests in flight (default 20)
+- PROXY_BENCH_PORT          proxy port; the stand-in uses the next one (default 18001)
+- PROXY_BENCH_TRANSPORTS    comma-separated, from tcp,uds (default both)
+- PROXY_BENCH_BURST         concurrency of the limiter burst check (default 100)
+- STANDIN_PAYLOAD_BYTES / STANDIN_LATENCY_MS / STANDIN_JITTER_MS  shape the stand-in
+- PROXY_* settings are passed through; the response cache and coalescing are
+  off unless set, so every request makes the upstream hop; the adaptive
+  limiter stays on, and a burst against the healthy stand-in must not be shed
+
+Results are written to test_reports/perf/proxy_overhead.json. Also runnable
+as a script: python -m tests.test_proxy_overhead
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+from tests.load_harness import REPORTS_DIR, run_load, save_results
+
+REQUESTS = int(os.environ.get('PROXY_BENCH_REQUESTS', '500'))
+CONCURRENCY = int(os.environ.get('PROXY_BENCH_CONCURRENCY', '20'))
+PROXY_PORT = int(os.environ.get('PROXY_BENCH_PORT', '18001'))
+STANDIN_PORT = PROXY_PORT + 1
+TRANSPORTS = os.environ.get('PROXY_BENCH_TRANSPORTS', 'tcp,uds').split(',')
+BURST = int(os.environ.get('PROXY_BENCH_BURST', '100'))
+UDS_DIR = tempfile.gettempdir()
+STANDIN_SOCKET = os.path.join(UDS_DIR, f'blockview-ts-{STANDIN_PORT}.sock')
+BACKEND_DIR = Path(__file__).parent.parent / 'backend'
+
+ADDRESS = '0xdac17f958d2ee523a2206206994597c13d831ec7'
+WALLET = '0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045'
+
+ENDPOINTS = {
+    'health': '/api/health',
+    'token_signals': f'/api/market/token-signals/{ADDRESS}',
+    'token_activity': f'/api/market/token-activity/{ADDRESS}',
+    'top_active_tokens': '/api/market/top-active-tokens?limit=5',
+    'top_active_tokens_64k': '/api/market/top-active-tokens?limit=5&_bytes=65536',
+    'wallet_activity_snapshot': f'/api/wallets/{WALLET}/activity-snapshot?window=24h',
+}
+
+pytestmark = pytest.mark.skipif(
+    os.environ.get('PROXY_BENCH') != '1',
+    reason='proxy benchmark is opt-in: set PROXY_BENCH=1',
+)
+
+
+def process_cpu_seconds(pid):
+    """utime + stime of one process from /proc (Linux), excluding children."""
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def start_proxy(transport='tcp'):
+    """Launch the proxy (which spawns the stand-in) and wait for /proxy/ready."""
+    env = dict(
+        os.environ,
+        TS_BACKEND='standin',
+        TS_PORT=str(STANDIN_PORT),
+        TS_WORKERS='1',
+        PROXY_UDS='true' if transport == 'uds' else 'false',
+        PROXY_UDS_DIR=UDS_DIR,
+        PROXY_CACHE_ENABLED=os.environ.get('PROXY_CACHE_ENABLED', 'false'),
+        PROXY_COALESCE_ENABLED=os.environ.get('PROXY_COALESCE_ENABLED', 'false'),
+        PROXY_LIMITER_ENABLED=os.environ.get('PROXY_LIMITER_ENABLED', 'true'),
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'server:app', '--port', str(PROXY_PORT), '--log-level', 'warning', '--no-access-log'],
+        cwd=str(BACKEND_DIR), env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f'http://127.0.0.1:{PROXY_PORT}/proxy/ready', timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        if process.poll() is not None:
+            break
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('proxy with stand-in backend did not become ready')
+
+
+def stop_proxy(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def measure(process, path, transport='tcp'):
+    """Direct vs. proxied run of one endpoint; returns both plus the overhead."""
+    uds = STANDIN_SOCKET if transport == 'uds' else None
+    direct = run_load(f'http://127.0.0.1:{STANDIN_PORT}', path, REQUESTS, CONCURRENCY, uds=uds)
+    cpu_before = process_cpu_seconds(process.pid)
+    proxied = run_load(f'http://127.0.0.1:{PROXY_PORT}', path, REQUESTS, CONCURRENCY, warmup=0)
+    cpu = process_cpu_seconds(process.pid) - cpu_before
+    overhead = {key: round(proxied[key] - direct[key], 2) for key in ('p50_ms', 'p95_ms', 'p99_ms')}
+    overhead['cpu_ms_per_request'] = round(cpu * 1000 / max(1, proxied['requests']), 3)
+    return {'direct': direct, 'proxied': proxied, 'overhead': overhead}
+
+
+def meta():
+    return {
+        'requests': REQUESTS,
+        'concurrency': CONCURRENCY,
+        'payload_bytes': int(os.environ.get('STANDIN_PAYLOAD_BYTES', '2048')),
+        'latency_ms': float(os.environ.get('STANDIN_LATENCY_MS', '0')),
+    }
+
+
+RESULTS = {}
+
+
+@pytest.fixture(scope='module', params=TRANSPORTS)
+def proxy(request):
+    process = start_proxy(request.param)
+    yield request.param, process
+    stop_proxy(process)
+    save_results(RESULTS, REPORTS_DIR / 'perf' / 'proxy_overhead.json', meta())
+
+
+class TestProxyOverhead:
+    """Latency and CPU the proxy adds in front of the stand-in backend"""
+
+    @pytest.mark.parametrize('name', list(ENDPOINTS))
+    def test_proxy_overhead(self, proxy, name):
+        """Proxied endpoint is error-free; overhead is reported"""
+        transport, process = proxy
+        result = measure(process, ENDPOINTS[name], transport)
+        RESULTS.setdefault(transport, {})[name] = result
+        print(f"\n{transport} {name}: overhead {result['overhead']}")
+
+        assert result['direct']['errors'] == 0
+        assert result['proxied']['errors'] == 0
+
+    @pytest.mark.parametrize('name', ['token_signals', 'wallet_activity_snapshot'])
+    def test_limiter_burst(self, proxy, name):
+        """A burst against the healthy stand-in is not shed by the adaptive limiter"""
+        result = run_load(f'http://127.0.0.1:{PROXY_PORT}', ENDPOINTS[name], BURST * 5, BURST, warmup=0)
+        limits = httpx.get(f'http://127.0.0.1:{PROXY_PORT}/proxy/limits', timeout=5).json()
+        print(f"\n{proxy[0]} {name} burst: {result['errors']} errors, limits {limits['limiter']['classes']}")
+
+        assert result['errors'] == 0
+
+
+def main():
+    for transport in TRANSPORTS:
+        process = start_proxy(transport)
+        try:
+            print(f"\n[{transport}]")
+            print(f"{'endpoint':<28}{'direct p50':>12}{'proxied p50':>13}{'+p50':>9}{'+p95':>9}{'+p99':>9}{'cpu ms/req':>12}")
+            for name, path in ENDPOINTS.items():
+                result = RESULTS.setdefault(transport, {})[name] = measure(process, path, transport)
+                overhead = result['overhead']
+                print(f"{name:<28}{result['direct']['p50_ms']:>12}{result['proxied']['p50_ms']:>13}"
+                      f"{overhead['p50_ms']:>9}{overhead['p95_ms']:>9}{overhead['p99_ms']:>9}{overhead['cpu_ms_per_request']:>12}")
+        finally:
+            stop_proxy(process)
+    if {'tcp', 'uds'} <= set(RESULTS):
+        print(f"\n{'endpoint':<28}{'tcp p50':>10}{'uds p50':>10}{'tcp cpu':>10}{'uds cpu':>10}")
+        for name in ENDPOINTS:
+            tcp, uds = RESULTS['tcp'][name], RESULTS['uds'][name]
+            print(f"{name:<28}{tcp['proxied']['p50_ms']:>10}{uds['proxied']['p50_ms']:>10}"
+                  f"{tcp['overhead']['cpu_ms_per_request']:>10}{uds['overhead']['cpu_ms_per_request']:>10}")
+    save_results(RESULTS, REPORTS_DIR / 'perf' / 'proxy_overhead.json', meta())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Proxy WebSocket Unit Tests (offline)
+
+Exercises backend/server.py's per-client send queue in-process, with no
+backend or network.
+Tests:
+- SendQueue overflow policies: drop-oldest, conflate, disconnect
+"""
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+import server  # noqa: E402
+
+
+def frame(**message):
+    return json.dumps(message)
+
+
+def queued(queue, field):
+    return [json.loads(text).get(field) for text in queue.frames]
+
+
+class TestDropOldest:
+    """'drop-oldest' keeps the newest maxsize frames"""
+
+    def test_drops_oldest_frames(self):
+        """Frames beyond maxsize push the oldest out and count as dropped"""
+        queue = server.SendQueue(maxsize=3, policy='drop-oldest')
+        for seq in range(5):
+            queue.put(frame(type='signal.new', seq=seq))
+        assert queued(queue, 'seq') == [2, 3, 4]
+        assert queue.dropped == 2
+
+
+class TestConflate:
+    """'conflate' merges frames for the same state before dropping anything"""
+
+    def test_distinct_events_are_not_conflated(self):
+        """Different alerts are separate events, never superseded by each other"""
+        queue = server.SendQueue(maxsize=3, policy='conflate')
+        for n in range(4):
+            queue.put(frame(type='alert.new', alertId=f"a{n}"))
+        # falls back to drop-oldest: only a0 goes
+        assert queued(queue, 'alertId') == ['a1', 'a2', 'a3']
+        assert queue.dropped == 1
+
+    def test_same_entity_keeps_latest(self):
+        """Repeated frames for one entity collapse to the newest"""
+        queue = server.SendQueue(maxsize=3, policy='conflate')
+        queue.put(frame(type='bootstrap.progress', dedupKey='b1', progress=10))
+        queue.put(frame(type='signal.new', signalId='s1'))
+        queue.put(frame(type='bootstrap.progress', dedupKey='b1', progress=20))
+        queue.put(frame(type='bootstrap.progress', dedupKey='b1', progress=30))
+        assert queued(queue, 'progress') == [None, 20, 30]
+        assert queue.dropped == 1
+
+    def test_channel_keys_conflation(self):
+        """Frames naming a channel conflate per channel"""
+        queue = server.SendQueue(maxsize=2, policy='conflate')
+        queue.put(frame(type='resolver.updated', channel='c1', seq=1))
+        queue.put(frame(type='resolver.updated', channel='c1', seq=2))
+        queue.put(frame(type='resolver.updated', channel='c2', seq=3))
+        assert queued(queue, 'seq') == [2, 3]
+
+    def test_same_id_in_other_category_is_distinct(self):
+        """An alert and a signal that share an id are different state"""
+        assert server.frame_channel(frame(type='alert.new', dedupKey='x')) != server.frame_channel(frame(type='signal.new', dedupKey='x'))
+        assert server.frame_channel(frame(type='alert.new')) is None
+        assert server.frame_channel('not json') is None
+
+
+class TestDisconnect:
+    """'disconnect' gives up on a client that cannot keep up"""
+
+    def test_overflow_ends_the_queue(self):
+        """Overflowing clears the queue, ignores further frames and get() returns None"""
+        queue = server.SendQueue(maxsize=2, policy='disconnect')
+        for seq in range(3):
+            queue.put(frame(type='signal.new', seq=seq))
+        queue.put(frame(type='signal.new', seq=3))
+        assert queue.overflowed and not queue.frames
+        assert queue.dropped == 3
+        assert asyncio.run(queue.get()) is None